@@ -0,0 +1,272 @@
+"""Cross-operation analytics backed by rollup tables.
+
+Metrics are folded into ``OperationRollup``, ``DailyRollup`` and
+``VehicleDailyRollup`` once, when an assignment is completed or an operation
+is closed. Range queries then only read a few rows per day instead of
+scanning assignments and vehicle assignments of every past operation.
+
+Vehicle time is counted from ``VehicleAssignment.assigned_at`` to the
+completion of the assignment for the vehicles still on it, and up to the
+removal for vehicles taken off earlier (``record_vehicle_released``). The
+response time is measured to ``Assignment.first_assigned_at``, which is kept
+even if that vehicle is removed again.
+"""
+from app import db
+from models import (Assignment, AssignmentStatus, DailyRollup, Location, Operation, OperationEvent,
+                    OperationRollup, Vehicle, VehicleAssignment, VehicleDailyRollup)
+from datetime import datetime, timedelta
+from sqlalchemy.dialects import postgresql, sqlite
+
+UPSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def _increment(model, keys, defaults=None, **deltas):
+    """Atomically add deltas to a rollup row, creating it if necessary"""
+    insert = UPSERTS.get(db.engine.dialect.name)
+    if insert is None:
+        # Other databases: update, then insert
+        values = {getattr(model, name): getattr(model, name) + delta for name, delta in deltas.items()}
+        query = model.query.filter_by(**keys)
+        updated = query.update(values, synchronize_session=False) if values else query.count()
+        if not updated:
+            db.session.add(model(**keys, **(defaults or {}), **deltas))
+            db.session.flush()
+        return
+
+    # Concurrent first writes of a new day or vehicle-day meet in ON CONFLICT instead of failing
+    statement = insert(model).values(**(defaults or {}), **keys, **deltas)
+    key_columns = [column.name for column in model.__table__.primary_key]
+    if deltas:
+        statement = statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={name: getattr(model, name) + delta for name, delta in deltas.items()}
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=key_columns)
+    db.session.execute(statement)
+
+
+def _split_by_day(start, end):
+    """Yield (day, seconds) for the part of [start, end) that falls on each day"""
+    while start < end:
+        next_day = datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+        chunk_end = min(end, next_day)
+        yield start.date(), (chunk_end - start).total_seconds()
+        start = chunk_end
+
+
+def _record_busy(vehicle_id, location_id, start, end, metrics):
+    """Add the busy time of one vehicle on an assignment and count the assignment on the day it ended"""
+    defaults = {'location_id': location_id}
+    for day, seconds in _split_by_day(start, end):
+        _increment(VehicleDailyRollup, {'vehicle_id': vehicle_id, 'day': day}, defaults, busy_seconds=seconds)
+        metrics['vehicle_seconds'] += seconds
+    _increment(VehicleDailyRollup, {'vehicle_id': vehicle_id, 'day': end.date()}, defaults, assignment_count=1)
+
+
+def record_vehicle_assigned(assignment, vehicle_assignment):
+    """Remember when the assignment got its first vehicle (for the response time)"""
+    if assignment.first_assigned_at is None:
+        assignment.first_assigned_at = vehicle_assignment.assigned_at
+
+
+def record_vehicle_released(assignment, vehicle_assignment, vehicle, released_at):
+    """Fold the busy time of a vehicle removed from an open assignment into the rollup tables"""
+    # Vehicles on a completed assignment were counted at completion
+    if assignment.status == AssignmentStatus.COMPLETED:
+        return
+    start = vehicle_assignment.assigned_at or assignment.created_at
+    metrics = {'vehicle_seconds': 0.0}
+    _record_busy(vehicle_assignment.vehicle_id, vehicle.location_id if vehicle else None,
+                 start, released_at, metrics)
+    _increment(DailyRollup, {'day': released_at.date()}, **metrics)
+    _increment(OperationRollup, {'operation_id': assignment.operation_id,
+                                 'day': assignment.operation.created_at.date()}, **metrics)
+
+
+def backfill_first_assigned():
+    """Set ``first_assigned_at`` of older assignments from the replay events or the remaining links"""
+    first_event = db.select(db.func.min(OperationEvent.timestamp)).where(
+        OperationEvent.event_type == 'vehicle_assigned',
+        OperationEvent.assignment_id == Assignment.id
+    ).scalar_subquery()
+    first_link = db.select(db.func.min(VehicleAssignment.assigned_at)).where(
+        VehicleAssignment.assignment_id == Assignment.id
+    ).scalar_subquery()
+    Assignment.query.filter(Assignment.first_assigned_at.is_(None)).update(
+        {Assignment.first_assigned_at: db.func.coalesce(first_event, first_link)}, synchronize_session=False
+    )
+
+
+def record_assignment_completed(assignment):
+    """Fold a freshly completed assignment into the rollup tables"""
+    completed_at = assignment.completed_at
+    links = assignment.vehicle_assignments
+    first_assigned = assignment.first_assigned_at or \
+        min((va.assigned_at for va in links if va.assigned_at), default=None)
+
+    metrics = {
+        'completed_count': 1,
+        'dispatched_count': 1 if first_assigned else 0,
+        'response_seconds': (first_assigned - assignment.created_at).total_seconds() if first_assigned else 0,
+        'completion_seconds': (completed_at - assignment.created_at).total_seconds(),
+        'vehicle_seconds': 0.0,
+    }
+
+    for va in links:
+        _record_busy(va.vehicle_id, va.vehicle.location_id,
+                     va.assigned_at or assignment.created_at, completed_at, metrics)
+
+    _increment(DailyRollup, {'day': completed_at.date()}, **metrics)
+    _increment(OperationRollup, {'operation_id': assignment.operation_id,
+                                 'day': assignment.operation.created_at.date()}, **metrics)
+
+
+def record_operation_closed(operation):
+    """Store the final figures of a closed operation"""
+    assignment_count = Assignment.query.filter_by(operation_id=operation.id).count()
+    _increment(OperationRollup, {'operation_id': operation.id, 'day': operation.created_at.date()})
+    OperationRollup.query.filter_by(operation_id=operation.id).update({
+        OperationRollup.assignment_count: assignment_count,
+        OperationRollup.duration_seconds: (operation.closed_at - operation.created_at).total_seconds()
+    }, synchronize_session=False)
+
+
+def rebuild_rollups():
+    """Recreate all rollup tables from the raw history"""
+    VehicleDailyRollup.query.delete()
+    DailyRollup.query.delete()
+    OperationRollup.query.delete()
+    db.session.flush()
+
+    # Walk the history in id batches to keep memory bounded
+    count = 0
+    last_id = 0
+    while True:
+        batch = Assignment.query.filter(
+            Assignment.id > last_id,
+            Assignment.status == AssignmentStatus.COMPLETED,
+            Assignment.completed_at.isnot(None)
+        ).order_by(Assignment.id).limit(500).all()
+        if not batch:
+            break
+        for assignment in batch:
+            record_assignment_completed(assignment)
+        count += len(batch)
+        last_id = batch[-1].id
+        db.session.expunge_all()
+    _rebuild_released()
+    for operation in Operation.query.filter(Operation.closed_at.isnot(None)):
+        record_operation_closed(operation)
+    db.session.commit()
+    return count
+
+
+def _rebuild_released():
+    """Busy time of vehicles removed from assignments, paired up from the replay events"""
+    assigned = {}
+    events = OperationEvent.query.filter(
+        OperationEvent.event_type.in_(('vehicle_assigned', 'vehicle_unassigned'))
+    ).order_by(OperationEvent.id).yield_per(1000)
+    released = []
+    for event in events:
+        key = (event.assignment_id, event.vehicle_id)
+        if event.event_type == 'vehicle_assigned':
+            assigned[key] = event.timestamp
+        elif key in assigned:
+            released.append((key, assigned.pop(key), event.timestamp))
+
+    for (assignment_id, vehicle_id), start, end in released:
+        assignment = db.session.get(Assignment, assignment_id)
+        if assignment is None:
+            continue
+        # The link is gone, so the completed pass did not count this vehicle
+        if assignment.completed_at is not None:
+            end = min(end, assignment.completed_at)
+        if end <= start:
+            continue
+        vehicle = db.session.get(Vehicle, vehicle_id)
+        metrics = {'vehicle_seconds': 0.0}
+        _record_busy(vehicle_id, vehicle.location_id if vehicle else None, start, end, metrics)
+        _increment(DailyRollup, {'day': end.date()}, **metrics)
+        _increment(OperationRollup, {'operation_id': assignment.operation_id,
+                                     'day': assignment.operation.created_at.date()}, **metrics)
+
+
+def _range(query, column, start, end):
+    if start:
+        query = query.filter(column >= start)
+    if end:
+        query = query.filter(column <= end)
+    return query
+
+
+def summary(start, end):
+    """Totals over a day range"""
+    row = _range(db.session.query(
+        db.func.coalesce(db.func.sum(DailyRollup.completed_count), 0),
+        db.func.coalesce(db.func.sum(DailyRollup.dispatched_count), 0),
+        db.func.coalesce(db.func.sum(DailyRollup.response_seconds), 0),
+        db.func.coalesce(db.func.sum(DailyRollup.completion_seconds), 0),
+        db.func.coalesce(db.func.sum(DailyRollup.vehicle_seconds), 0)
+    ), DailyRollup.day, start, end).one()
+    completed, dispatched, response, completion, vehicle = row
+    return {
+        'from': start.isoformat() if start else None,
+        'to': end.isoformat() if end else None,
+        'completed_count': completed,
+        'dispatched_count': dispatched,
+        'avg_response_seconds': response / dispatched if dispatched else None,
+        'avg_completion_seconds': completion / completed if completed else None,
+        'vehicle_hours': vehicle / 3600
+    }
+
+
+def daily(start, end):
+    """One row per day in the range"""
+    rows = _range(DailyRollup.query, DailyRollup.day, start, end).order_by(DailyRollup.day).all()
+    return [row.to_dict() for row in rows]
+
+
+def operations(start, end):
+    """One row per operation created in the range"""
+    rows = _range(OperationRollup.query, OperationRollup.day, start, end).order_by(
+        OperationRollup.day, OperationRollup.operation_id
+    ).all()
+    return [row.to_dict() for row in rows]
+
+
+def vehicles(start, end):
+    """Assignments and busy hours per vehicle over the range"""
+    rows = _range(db.session.query(
+        VehicleDailyRollup.vehicle_id,
+        db.func.sum(VehicleDailyRollup.assignment_count),
+        db.func.sum(VehicleDailyRollup.busy_seconds)
+    ), VehicleDailyRollup.day, start, end).group_by(VehicleDailyRollup.vehicle_id).all()
+    callsigns = dict(db.session.query(Vehicle.id, Vehicle.callsign).filter(
+        Vehicle.id.in_([row[0] for row in rows])
+    ).all()) if rows else {}
+    return [{
+        'vehicle_id': vehicle_id,
+        'callsign': callsigns.get(vehicle_id),
+        'assignment_count': assignment_count,
+        'busy_hours': busy_seconds / 3600
+    } for vehicle_id, assignment_count, busy_seconds in rows]
+
+
+def stations(start, end):
+    """Assignments and busy hours per station over the range"""
+    rows = _range(db.session.query(
+        VehicleDailyRollup.location_id,
+        db.func.sum(VehicleDailyRollup.assignment_count),
+        db.func.sum(VehicleDailyRollup.busy_seconds)
+    ), VehicleDailyRollup.day, start, end).group_by(VehicleDailyRollup.location_id).all()
+    names = dict(db.session.query(Location.id, Location.name).filter(
+        Location.id.in_([row[0] for row in rows if row[0] is not None])
+    ).all()) if rows else {}
+    return [{
+        'location_id': location_id,
+        'location_name': names.get(location_id, 'Ohne Standort') if location_id else 'Ohne Standort',
+        'assignment_count': assignment_count,
+        'busy_hours': busy_seconds / 3600
+    } for location_id, assignment_count, busy_seconds in rows]
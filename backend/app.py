@@ -1,12 +1,19 @@
 from flask import Flask, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from db_routing import RoutingSession
+import db_routing
+from startup_profile import timed
+import click
 import os
+import sys
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 def create_app():
+    timings = {}
     app = Flask(__name__, static_folder='/app/static', static_url_path='')
+    app.extensions['startup_timings'] = timings
     CORS(app)
     
     # Configuration
@@ -15,19 +22,91 @@ def create_app():
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
     app.config['UPLOAD_FOLDER'] = '/app/uploads'
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    app.config['SCHEMA_AUTO_UPGRADE'] = os.environ.get('SCHEMA_AUTO_UPGRADE', '1') != '0'
+    db_routing.configure(app, os.environ)
     
     # Initialize extensions
     db.init_app(app)
+    db_routing.init_app(app)
+    import sync
+    sync.init_app(app)
+    import idempotency
+    idempotency.init_app(app)
     
     # Register blueprints
-    from routes import operations, locations, vehicles, assignments, journal, settings, api_external
-    app.register_blueprint(operations.bp)
-    app.register_blueprint(locations.bp)
-    app.register_blueprint(vehicles.bp)
-    app.register_blueprint(assignments.bp)
-    app.register_blueprint(journal.bp)
-    app.register_blueprint(settings.bp)
-    app.register_blueprint(api_external.bp)
+    with timed(timings, 'blueprints'):
+        from routes import operations, locations, vehicles, assignments, journal, settings, api_external, analytics, symbols
+        from routes import sync as sync_routes
+        app.register_blueprint(operations.bp)
+        app.register_blueprint(locations.bp)
+        app.register_blueprint(vehicles.bp)
+        app.register_blueprint(assignments.bp)
+        app.register_blueprint(journal.bp)
+        app.register_blueprint(settings.bp)
+        app.register_blueprint(api_external.bp)
+        app.register_blueprint(analytics.bp)
+        app.register_blueprint(symbols.bp)
+        app.register_blueprint(sync_routes.bp)
+    
+    # Tactical symbol sprite is built on first request
+    import tactical_symbols
+    tactical_symbols.init_app(app)
+    
+    # CLI commands
+    @app.cli.command('init-db')
+    def init_db():
+        """Create missing tables and record the schema version"""
+        import schema
+        schema.upgrade()
+        print(f"Database schema is at version {schema.SCHEMA_VERSION}")
+    
+    @app.cli.command('rebuild-analytics')
+    def rebuild_analytics():
+        """Recreate the analytics rollup tables from the raw history"""
+        import analytics as analytics_rollups
+        count = analytics_rollups.rebuild_rollups()
+        print(f"Rebuilt analytics from {count} completed assignments")
+    
+    @app.cli.command('rebuild-replay')
+    @click.option('--all', 'rebuild_every', is_flag=True, help='Also replace recorded history')
+    def rebuild_replay(rebuild_every):
+        """Synthesize replay events and checkpoints from the current tables"""
+        import replay
+        count = replay.rebuild_all(only_missing=not rebuild_every)
+        print(f"Rebuilt replay history for {count} operations")
+    
+    @app.cli.command('import-master-data')
+    @click.argument('kind', type=click.Choice(['locations', 'vehicles']))
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    def import_master_data(kind, path):
+        """Import locations or vehicles from a CSV or JSON file"""
+        import master_data
+        with open(path, 'rb') as f:
+            content = f.read()
+        
+        def progress(address, result):
+            status = 'error' if isinstance(result, Exception) else ('ok' if result else 'not found')
+            print(f"  geocoded {address}: {status}")
+        
+        try:
+            rows = master_data.parse_rows(content, path)
+            if kind == 'locations':
+                import geocoding
+                report = master_data.import_locations(rows, geocoding.get_geolocator(), progress=progress)
+            else:
+                report = master_data.import_vehicles(rows)
+        except master_data.ImportValidationError as e:
+            print(f"Import failed: {e}")
+            for error in e.errors:
+                print(f"  row {error['row']} ({error['field']}): {error['error']}")
+            raise SystemExit(1)
+        
+        for entry in report:
+            line = f"  row {entry['row']}: {entry['action']} {entry.get('name') or entry.get('callsign')}"
+            if entry.get('warning'):
+                line += f" ({entry['warning']})"
+            print(line)
+        print(f"Imported {len(report)} {kind}")
     
     # Serve static files
     @app.route('/')
@@ -41,13 +120,18 @@ def create_app():
         # If file doesn't exist, return index.html for client-side routing
         return send_from_directory('/app/static', 'index.html')
     
-    # Create tables
-    with app.app_context():
-        db.create_all()
+    # Check the schema version (tables are only created for a new or outdated database)
+    with timed(timings, 'schema'), app.app_context():
+        import schema
+        schema.verify(auto_upgrade=app.config['SCHEMA_AUTO_UPGRADE'])
     
     return app
 
 if __name__ == '__main__':
+    if '--profile-startup' in sys.argv:
+        import startup_profile
+        sys.exit(startup_profile.main(sys.argv[1:]))
+    
     app = create_app()
     # Debug mode is controlled by FLASK_ENV environment variable
     app.run(host='0.0.0.0', port=5000, debug=False)
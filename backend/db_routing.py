@@ -0,0 +1,76 @@
+"""Read/write routing between the primary database and a read replica.
+
+If ``DATABASE_READ_URL`` is set, it is registered as the ``read`` bind and
+queries issued while handling ``GET``/``HEAD`` requests go there. Everything
+else - other request methods, flushes, INSERT/UPDATE/DELETE statements and
+work outside of a request (CLI, startup) - uses the primary.
+
+After a client writes, a cookie pins its reads to the primary for
+``DATABASE_READ_PIN_SECONDS`` (default 5) so it always sees its own changes
+even if the replica lags behind.
+
+A ``GET`` handler that may write (e.g. building a missing row on first
+access) must call ``use_primary()`` before it reads the rows it is going to
+write, otherwise it decides on replica data and writes to the primary.
+
+For local testing two SQLite files work: point ``DATABASE_READ_URL`` at a
+copy of the primary file (or at the same file).
+"""
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+import sqlalchemy as sa
+import time
+
+READ_BIND = 'read'
+READ_METHODS = ('GET', 'HEAD')
+PIN_COOKIE = 'tel_primary_until'
+
+
+def _use_replica():
+    if not has_request_context() or request.method not in READ_METHODS:
+        return False
+    if g.get('db_use_primary'):
+        return False
+    try:
+        pinned_until = float(request.cookies.get(PIN_COOKIE, 0))
+    except ValueError:
+        pinned_until = 0
+    return pinned_until < time.time()
+
+
+class RoutingSession(Session):
+    """Session that sends reads of GET requests to the read replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, sa.UpdateBase):
+            engines = self._db.engines
+            if READ_BIND in engines and _use_replica():
+                return engines[READ_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_primary():
+    """Force the rest of the current request onto the primary"""
+    if has_request_context():
+        g.db_use_primary = True
+
+
+def configure(app, environ):
+    """Register the read bind if a replica URL is configured"""
+    read_url = environ.get('DATABASE_READ_URL')
+    if read_url:
+        app.config.setdefault('SQLALCHEMY_BINDS', {})[READ_BIND] = read_url
+    app.config['DATABASE_READ_PIN_SECONDS'] = float(environ.get('DATABASE_READ_PIN_SECONDS', 5))
+
+
+def init_app(app):
+    """Pin clients to the primary for a short window after they wrote"""
+
+    @app.after_request
+    def pin_after_write(response):
+        if READ_BIND in app.config.get('SQLALCHEMY_BINDS', {}) \
+                and request.method not in READ_METHODS + ('OPTIONS',) and response.status_code < 400:
+            pin_seconds = app.config['DATABASE_READ_PIN_SECONDS']
+            response.set_cookie(PIN_COOKIE, str(time.time() + pin_seconds),
+                                max_age=int(pin_seconds) + 1, httponly=True, samesite='Lax')
+        return response
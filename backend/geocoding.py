@@ -0,0 +1,22 @@
+"""Shared geocoder, created on first use.
+
+geopy is only imported when an address actually has to be resolved, so
+application startup does not pay for it.
+"""
+import os
+
+_geolocator = None
+
+
+def get_geolocator():
+    """Return the process-wide Nominatim geocoder"""
+    global _geolocator
+    if _geolocator is None:
+        from geopy.geocoders import Nominatim
+        _geolocator = Nominatim(user_agent=os.environ.get('GEOCODER_USER_AGENT', 'tel-system'))
+    return _geolocator
+
+
+def geocode(address):
+    """Geocode a single address (None if it could not be resolved)"""
+    return get_geolocator().geocode(address)
@@ -0,0 +1,80 @@
+"""Idempotent writes for the offline outbox.
+
+The outbox (``frontend/js/offline-store.js``) sends every write with a
+client-generated ``Idempotency-Key`` header and sends it again if the
+response did not arrive, even though the server may already have committed
+the write. The key is stored in the same transaction as the write, and the
+response is stored once the request finishes. A repeated request then gets
+the stored response back instead of creating a second assignment or journal
+entry. Keys are kept for ``IDEMPOTENCY_KEEP_HOURS`` (default 72).
+"""
+from flask import current_app, g, has_request_context, jsonify, request
+from app import db
+from models import IdempotencyKey
+from datetime import datetime, timedelta
+import sqlalchemy as sa
+import db_routing
+import os
+
+KEY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 100
+
+
+def _save_key(session):
+    """Store the key of the current request with its first commit"""
+    if not has_request_context() or not g.get('idempotency_key') or g.get('idempotency_saved'):
+        return
+    session.add(IdempotencyKey(key=g.idempotency_key, method=request.method, path=request.path))
+    g.idempotency_saved = True
+
+
+def _reset(session, *args):
+    if has_request_context():
+        g.pop('idempotency_saved', None)
+
+
+def _stored_response(entry):
+    if entry.method != request.method or entry.path != request.path:
+        return jsonify({'error': 'Idempotency key was already used for a different request'}), 422
+    if entry.status_code is None:
+        # Committed, but the request did not finish storing its response
+        return jsonify({'error': 'Request was already processed'}), 409
+    response = current_app.response_class(entry.response, status=entry.status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def init_app(app):
+    """Answer repeated writes from the stored response"""
+    keep = timedelta(hours=float(os.environ.get('IDEMPOTENCY_KEEP_HOURS', 72)))
+
+    if not sa.event.contains(db_routing.RoutingSession, 'before_commit', _save_key):
+        sa.event.listen(db_routing.RoutingSession, 'before_commit', _save_key)
+        sa.event.listen(db_routing.RoutingSession, 'after_rollback', _reset)
+
+    @app.before_request
+    def replay_stored_response():
+        key = request.headers.get(KEY_HEADER)
+        if not key or request.method in db_routing.READ_METHODS + ('OPTIONS',):
+            return None
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{KEY_HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+        # The key may have been written moments ago
+        db_routing.use_primary()
+        entry = db.session.get(IdempotencyKey, key)
+        if entry is not None:
+            return _stored_response(entry)
+        g.idempotency_key = key
+        return None
+
+    @app.after_request
+    def store_response(response):
+        if not g.get('idempotency_saved'):
+            return response
+        IdempotencyKey.query.filter_by(key=g.idempotency_key).update({
+            IdempotencyKey.status_code: response.status_code,
+            IdempotencyKey.response: response.get_data(as_text=True)
+        })
+        IdempotencyKey.query.filter(IdempotencyKey.created_at < datetime.utcnow() - keep).delete()
+        db.session.commit()
+        return response
@@ -0,0 +1,301 @@
+"""Bulk import of master data (locations and vehicles).
+
+Files are parsed (CSV or JSON) and validated completely before anything is
+written. Addresses of new or changed locations are geocoded through a small
+thread pool sharing one rate limiter, then all rows are upserted in a single
+transaction.
+
+Nominatim allows one lookup per second, so an HTTP import geocodes at most
+``GEOCODE_MAX_PER_REQUEST`` addresses (default 20). The remaining locations
+are saved without coordinates and reported with a warning; importing the
+file again geocodes the next ones, and ``flask import-master-data`` has no
+limit.
+"""
+from app import db
+from models import Location, Vehicle
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import csv
+import io
+import json
+import math
+import os
+import operation_stats
+
+
+class ImportValidationError(Exception):
+    """Raised when an import file cannot be parsed or contains invalid rows"""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+    def to_dict(self):
+        return {'error': str(self), 'errors': self.errors}
+
+
+def _decode(content):
+    """Text of an uploaded file: UTF-8, or Windows-1252 as exported by Excel"""
+    for encoding in ('utf-8-sig', 'cp1252'):
+        try:
+            return content.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    raise ImportValidationError('File must be UTF-8 or Windows-1252 encoded')
+
+
+def parse_rows(content, filename=None, content_type=None):
+    """Parse CSV or JSON content into a list of dicts"""
+    if isinstance(content, bytes):
+        content = _decode(content)
+    is_json = (filename or '').lower().endswith('.json') or 'json' in (content_type or '') \
+        or content.lstrip().startswith('[')
+    if is_json:
+        try:
+            rows = json.loads(content)
+        except ValueError as e:
+            raise ImportValidationError(f'Invalid JSON: {e}')
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise ImportValidationError('JSON import must be a list of objects')
+        return rows
+
+    sample = content[:2048]
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(content), dialect=dialect)
+    return [{k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+            for row in reader]
+
+
+def rows_from_request(request):
+    """Read import rows from an uploaded file, a JSON body or a raw CSV body"""
+    if 'file' in request.files:
+        upload = request.files['file']
+        return parse_rows(upload.read(), upload.filename, upload.mimetype)
+    if request.is_json:
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise ImportValidationError('JSON import must be a list of objects')
+        return rows
+    return parse_rows(request.get_data(), content_type=request.content_type)
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _text(value, field, errors, row_number):
+    """Stripped string value, None if blank; JSON numbers, lists etc. are row errors"""
+    if _blank(value):
+        return None
+    if not isinstance(value, str):
+        errors.append({'row': row_number, 'field': field, 'error': f'{field} must be a string'})
+        return None
+    return value.strip()
+
+
+def _number(value, cast, field, errors, row_number):
+    if _blank(value):
+        return None
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        errors.append({'row': row_number, 'field': field, 'error': f'Invalid number: {value}'})
+        return None
+    if cast is int and isinstance(value, float) and not value.is_integer():
+        errors.append({'row': row_number, 'field': field, 'error': f'{field} must be a whole number'})
+        return None
+    try:
+        number = cast(str(value).replace(',', '.') if cast is float else value)
+    except (TypeError, ValueError, OverflowError):
+        errors.append({'row': row_number, 'field': field, 'error': f'Invalid number: {value}'})
+        return None
+    if not math.isfinite(number):
+        errors.append({'row': row_number, 'field': field, 'error': f'Invalid number: {value}'})
+        return None
+    return number
+
+
+def validate_locations(rows):
+    """Normalize location rows, raising ImportValidationError with all row errors"""
+    errors = []
+    result = []
+    seen = set()
+    for row_number, row in enumerate(rows, start=1):
+        name = _text(row.get('name'), 'name', errors, row_number)
+        address = _text(row.get('address'), 'address', errors, row_number)
+        if _blank(row.get('name')):
+            errors.append({'row': row_number, 'field': 'name', 'error': 'name is required'})
+        elif name is not None and name in seen:
+            errors.append({'row': row_number, 'field': 'name', 'error': f'Duplicate name: {name}'})
+        elif name is not None:
+            seen.add(name)
+        if _blank(row.get('address')):
+            errors.append({'row': row_number, 'field': 'address', 'error': 'address is required'})
+        latitude = _number(row.get('latitude'), float, 'latitude', errors, row_number)
+        longitude = _number(row.get('longitude'), float, 'longitude', errors, row_number)
+        if _blank(row.get('latitude')) != _blank(row.get('longitude')):
+            field = 'longitude' if _blank(row.get('longitude')) else 'latitude'
+            errors.append({'row': row_number, 'field': field, 'error': 'latitude and longitude must be given together'})
+        result.append({
+            'row': row_number,
+            'name': name,
+            'address': address,
+            'latitude': latitude,
+            'longitude': longitude
+        })
+    if errors:
+        raise ImportValidationError('Import file contains invalid rows', errors)
+    return result
+
+
+def validate_vehicles(rows):
+    """Normalize vehicle rows and resolve station names, raising ImportValidationError with all row errors"""
+    errors = []
+    result = []
+    seen = set()
+    locations_by_name = {}
+    for location in Location.query.order_by(Location.id).all():
+        locations_by_name.setdefault(location.name, location.id)
+    location_ids = set(locations_by_name.values())
+
+    for row_number, row in enumerate(rows, start=1):
+        callsign = _text(row.get('callsign'), 'callsign', errors, row_number)
+        if _blank(row.get('callsign')):
+            errors.append({'row': row_number, 'field': 'callsign', 'error': 'callsign is required'})
+        elif callsign is not None and callsign in seen:
+            errors.append({'row': row_number, 'field': 'callsign', 'error': f'Duplicate callsign: {callsign}'})
+        elif callsign is not None:
+            seen.add(callsign)
+
+        crew_count = _number(row.get('crew_count'), int, 'crew_count', errors, row_number)
+        location_id = _number(row.get('location_id'), int, 'location_id', errors, row_number)
+        vehicle_type = _text(row.get('vehicle_type'), 'vehicle_type', errors, row_number)
+        notes = _text(row.get('notes'), 'notes', errors, row_number)
+        location_name = _text(row.get('location'), 'location', errors, row_number)
+        if location_name is not None:
+            location_id = locations_by_name.get(location_name)
+            if location_id is None:
+                errors.append({'row': row_number, 'field': 'location', 'error': f'Unknown location: {location_name}'})
+        elif location_id is not None and location_id not in location_ids:
+            errors.append({'row': row_number, 'field': 'location_id', 'error': f'Unknown location_id: {location_id}'})
+
+        # Columns missing from the file keep their current value on update
+        normalized = {'row': row_number, 'callsign': callsign}
+        if 'vehicle_type' in row:
+            normalized['vehicle_type'] = vehicle_type
+        if 'crew_count' in row:
+            normalized['crew_count'] = crew_count or 0
+        if 'location' in row or 'location_id' in row:
+            normalized['location_id'] = location_id
+        if 'notes' in row:
+            normalized['notes'] = notes
+        result.append(normalized)
+    if errors:
+        raise ImportValidationError('Import file contains invalid rows', errors)
+    return result
+
+
+def geocode_addresses(addresses, geolocator, workers=None, min_delay=None, progress=None):
+    """Geocode addresses in parallel while honouring the geocoder's rate limit.
+
+    Returns a dict address -> (latitude, longitude) or an Exception/None.
+    """
+    workers = workers or int(os.environ.get('GEOCODE_WORKERS', 4))
+    min_delay = min_delay if min_delay is not None else float(os.environ.get('GEOCODE_MIN_DELAY', 1.0))
+    from geopy.extra.rate_limiter import RateLimiter
+    geocode = RateLimiter(geolocator.geocode, min_delay_seconds=min_delay, max_retries=2,
+                          error_wait_seconds=max(min_delay, 2.0), swallow_exceptions=False)
+
+    def lookup(address):
+        geo_result = geocode(address)
+        return (geo_result.latitude, geo_result.longitude) if geo_result else None
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(lookup, address): address for address in set(addresses)}
+        for future in as_completed(futures):
+            address = futures[future]
+            try:
+                results[address] = future.result()
+            except Exception as e:
+                results[address] = e
+            if progress:
+                progress(address, results[address])
+    return results
+
+
+def import_locations(rows, geolocator, progress=None, max_geocode=None):
+    """Validate, geocode (at most ``max_geocode`` addresses) and upsert locations by name in one transaction"""
+    rows = validate_locations(rows)
+    existing = {}
+    for location in Location.query.order_by(Location.id).all():
+        existing.setdefault(location.name, location)
+
+    # Only geocode new or changed addresses without explicit coordinates
+    to_geocode = [r['address'] for r in rows
+                  if r['latitude'] is None and r['longitude'] is None
+                  and (r['name'] not in existing or existing[r['name']].address != r['address']
+                       or existing[r['name']].latitude is None)]
+    to_geocode = list(dict.fromkeys(to_geocode))
+    skipped = set(to_geocode[max_geocode:]) if max_geocode is not None else set()
+    to_geocode = to_geocode[:max_geocode] if max_geocode is not None else to_geocode
+    coordinates = geocode_addresses(to_geocode, geolocator, progress=progress) if to_geocode else {}
+
+    report = []
+    for r in rows:
+        entry = {'row': r['row'], 'name': r['name']}
+        location = existing.get(r['name'])
+        if location is None:
+            location = Location(name=r['name'])
+            db.session.add(location)
+            entry['action'] = 'created'
+        else:
+            entry['action'] = 'updated'
+        location.address = r['address']
+
+        if r['latitude'] is not None or r['longitude'] is not None:
+            location.latitude = r['latitude']
+            location.longitude = r['longitude']
+        elif r['address'] in coordinates:
+            geo_result = coordinates[r['address']]
+            if isinstance(geo_result, Exception):
+                entry['warning'] = f'Geocoding error: {geo_result}'
+            elif geo_result is None:
+                entry['warning'] = 'Address not found'
+            else:
+                location.latitude, location.longitude = geo_result
+                entry['geocoded'] = True
+        elif r['address'] in skipped:
+            entry['warning'] = 'Not geocoded (limit per request reached), import again to continue'
+        report.append(entry)
+
+    db.session.commit()
+    return report
+
+
+def import_vehicles(rows):
+    """Validate and upsert vehicles by callsign in one transaction"""
+    rows = validate_vehicles(rows)
+    existing = {v.callsign: v for v in Vehicle.query.all()}
+
+    report = []
+    for r in rows:
+        entry = {'row': r['row'], 'callsign': r['callsign']}
+        vehicle = existing.get(r['callsign'])
+        if vehicle is None:
+            vehicle = Vehicle(callsign=r['callsign'], crew_count=r.get('crew_count', 0))
+            db.session.add(vehicle)
+            entry['action'] = 'created'
+        else:
+            entry['action'] = 'updated'
+            if 'crew_count' in r and vehicle.crew_count != r['crew_count']:
+                old_crew_count = vehicle.crew_count
+                vehicle.crew_count = r['crew_count']
+                operation_stats.vehicle_crew_changed(vehicle, old_crew_count)
+        for field in ('vehicle_type', 'location_id', 'notes'):
+            if field in r:
+                setattr(vehicle, field, r[field])
+        report.append(entry)
+
+    db.session.commit()
+    return report
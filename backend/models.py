@@ -19,6 +19,10 @@ class Operation(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     closed_at = db.Column(db.DateTime)
     
+    __table_args__ = (
+        db.Index('ix_operations_status_created', 'status', 'created_at'),
+    )
+    
     # Relationships
     assignments = db.relationship('Assignment', back_populates='operation', cascade='all, delete-orphan')
     journal_entries = db.relationship('JournalEntry', back_populates='operation', cascade='all, delete-orphan')
@@ -107,6 +111,11 @@ class Assignment(db.Model):
     pdf_file = db.Column(db.String(500))  # Path to PDF file
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     completed_at = db.Column(db.DateTime)
+    first_assigned_at = db.Column(db.DateTime)  # First vehicle assigned, kept if it is removed again
+    
+    __table_args__ = (
+        db.Index('ix_assignments_operation_status_created', 'operation_id', 'status', 'created_at'),
+    )
     
     # Relationships
     operation = db.relationship('Operation', back_populates='assignments')
@@ -137,9 +146,13 @@ class VehicleAssignment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), nullable=False)
     assignment_id = db.Column(db.Integer, db.ForeignKey('assignments.id'), nullable=False)
-    order = db.Column(db.Integer, default=0)  # Order in queue
+    order = db.Column(db.Integer, default=0)  # Order in the vehicle's queue within the operation
     assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_vehicle_assignments_vehicle_assignment', 'vehicle_id', 'assignment_id'),
+    )
+    
     # Relationships
     vehicle = db.relationship('Vehicle', back_populates='assignments')
     assignment = db.relationship('Assignment', back_populates='vehicle_assignments')
@@ -153,6 +166,200 @@ class VehicleAssignment(db.Model):
             'assigned_at': self.assigned_at.isoformat() if self.assigned_at else None
         }
 
+class OperationStats(db.Model):
+    """Einsatzstatistik - Counters per operation, maintained on every mutation"""
+    __tablename__ = 'operation_stats'
+    
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id'), primary_key=True)
+    open_count = db.Column(db.Integer, default=0, nullable=False)
+    assigned_count = db.Column(db.Integer, default=0, nullable=False)
+    completed_count = db.Column(db.Integer, default=0, nullable=False)
+    vehicle_count = db.Column(db.Integer, default=0, nullable=False)  # Distinct committed vehicles
+    personnel_count = db.Column(db.Integer, default=0, nullable=False)  # Summed crew_count of committed vehicles
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'operation_id': self.operation_id,
+            'assignments': {
+                'total': self.open_count + self.assigned_count + self.completed_count,
+                'open': self.open_count,
+                'assigned': self.assigned_count,
+                'completed': self.completed_count
+            },
+            'vehicles': self.vehicle_count,
+            'personnel': self.personnel_count,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class OperationRevision(db.Model):
+    """Revision counter per operation, incremented on every change of its data"""
+    __tablename__ = 'operation_revisions'
+    
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id'), primary_key=True)
+    revision = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'operation_id': self.operation_id,
+            'revision': self.revision,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class SyncChange(db.Model):
+    """Latest change of a row as seen by the clients of an operation (delta sync)"""
+    __tablename__ = 'sync_changes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id'), nullable=False)
+    revision = db.Column(db.Integer, nullable=False)  # Operation revision of the change
+    entity = db.Column(db.String(20), nullable=False)  # assignment, journal, vehicle, operation
+    entity_id = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, default=False, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_sync_changes_operation_revision', 'operation_id', 'revision'),
+        db.Index('ix_sync_changes_operation_entity', 'operation_id', 'entity', 'entity_id'),
+    )
+
+class OperationRollup(db.Model):
+    """Auswertung je Einsatzlage - Precomputed response metrics per operation"""
+    __tablename__ = 'analytics_operations'
+    
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id'), primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)  # Day the operation was created
+    completed_count = db.Column(db.Integer, default=0, nullable=False)
+    dispatched_count = db.Column(db.Integer, default=0, nullable=False)  # Completed assignments that had a vehicle
+    response_seconds = db.Column(db.Float, default=0, nullable=False)  # Sum of created_at -> first_assigned_at
+    completion_seconds = db.Column(db.Float, default=0, nullable=False)  # Sum of created_at -> completed_at
+    vehicle_seconds = db.Column(db.Float, default=0, nullable=False)  # Sum of assigned_at -> completed_at or removal
+    assignment_count = db.Column(db.Integer)  # Set when the operation is closed
+    duration_seconds = db.Column(db.Float)  # Set when the operation is closed
+    
+    def to_dict(self):
+        return {
+            'operation_id': self.operation_id,
+            'day': self.day.isoformat() if self.day else None,
+            'completed_count': self.completed_count,
+            'dispatched_count': self.dispatched_count,
+            'avg_response_seconds': self.response_seconds / self.dispatched_count if self.dispatched_count else None,
+            'avg_completion_seconds': self.completion_seconds / self.completed_count if self.completed_count else None,
+            'vehicle_hours': self.vehicle_seconds / 3600,
+            'assignment_count': self.assignment_count,
+            'duration_seconds': self.duration_seconds
+        }
+
+class DailyRollup(db.Model):
+    """Auswertung je Tag - Precomputed response metrics per day of completion"""
+    __tablename__ = 'analytics_days'
+    
+    day = db.Column(db.Date, primary_key=True)
+    completed_count = db.Column(db.Integer, default=0, nullable=False)
+    dispatched_count = db.Column(db.Integer, default=0, nullable=False)
+    response_seconds = db.Column(db.Float, default=0, nullable=False)
+    completion_seconds = db.Column(db.Float, default=0, nullable=False)
+    vehicle_seconds = db.Column(db.Float, default=0, nullable=False)
+    
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'completed_count': self.completed_count,
+            'dispatched_count': self.dispatched_count,
+            'avg_response_seconds': self.response_seconds / self.dispatched_count if self.dispatched_count else None,
+            'avg_completion_seconds': self.completion_seconds / self.completed_count if self.completed_count else None,
+            'vehicle_hours': self.vehicle_seconds / 3600
+        }
+
+class VehicleDailyRollup(db.Model):
+    """Auswertung je Fahrzeug und Tag - Assignments and busy time per vehicle"""
+    __tablename__ = 'analytics_vehicle_days'
+    
+    vehicle_id = db.Column(db.Integer, primary_key=True)  # No FK, rollups outlive deleted vehicles
+    day = db.Column(db.Date, primary_key=True)
+    location_id = db.Column(db.Integer)  # Station of the vehicle at the time of the assignment
+    assignment_count = db.Column(db.Integer, default=0, nullable=False)
+    busy_seconds = db.Column(db.Float, default=0, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_analytics_vehicle_days_day_location', 'day', 'location_id'),
+    )
+    
+    def to_dict(self):
+        return {
+            'vehicle_id': self.vehicle_id,
+            'day': self.day.isoformat(),
+            'location_id': self.location_id,
+            'assignment_count': self.assignment_count,
+            'busy_hours': self.busy_seconds / 3600
+        }
+
+class VehicleStatusReport(db.Model):
+    """FMS-Statusmeldung - Status telegram of a vehicle (history)"""
+    __tablename__ = 'vehicle_status_history'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    vehicle_id = db.Column(db.Integer, nullable=False)  # No FK, history outlives deleted vehicles
+    status = db.Column(db.Integer, nullable=False)  # FMS status 0-9
+    timestamp = db.Column(db.DateTime, nullable=False)  # Time reported by the gateway
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    source = db.Column(db.String(100))  # API client that delivered the telegram
+    
+    __table_args__ = (
+        db.Index('ix_vehicle_status_history_vehicle_timestamp', 'vehicle_id', 'timestamp'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'vehicle_id': self.vehicle_id,
+            'status': self.status,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'source': self.source
+        }
+
+class OperationEvent(db.Model):
+    """Structured change event of an operation, used for time-travel replay"""
+    __tablename__ = 'operation_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    event_type = db.Column(db.String(50), nullable=False)  # assignment_created, vehicle_assigned, etc.
+    assignment_id = db.Column(db.Integer)
+    vehicle_id = db.Column(db.Integer)
+    data = db.Column(db.JSON)
+    
+    __table_args__ = (
+        db.Index('ix_operation_events_operation_timestamp', 'operation_id', 'timestamp', 'id'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'operation_id': self.operation_id,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'event_type': self.event_type,
+            'assignment_id': self.assignment_id,
+            'vehicle_id': self.vehicle_id,
+            'data': self.data
+        }
+
+class OperationCheckpoint(db.Model):
+    """Full replay state of an operation after a given event"""
+    __tablename__ = 'operation_checkpoints'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    operation_id = db.Column(db.Integer, db.ForeignKey('operations.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)  # Latest timestamp of the included events
+    last_event_id = db.Column(db.Integer, nullable=False)  # Includes all events up to this id
+    state = db.Column(db.JSON, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_operation_checkpoints_operation_timestamp', 'operation_id', 'timestamp'),
+    )
+
 class JournalEntry(db.Model):
     """Journal/Logbook entry - Einsatztagebuch"""
     __tablename__ = 'journal_entries'
@@ -164,6 +371,11 @@ class JournalEntry(db.Model):
     entry_type = db.Column(db.String(50))  # instruction, note, decision, status_change, etc.
     content = db.Column(db.Text, nullable=False)
     
+    __table_args__ = (
+        db.Index('ix_journal_entries_operation_timestamp', 'operation_id', 'timestamp'),
+        db.Index('ix_journal_entries_assignment_timestamp', 'assignment_id', 'timestamp'),
+    )
+    
     # Relationships
     operation = db.relationship('Operation', back_populates='journal_entries')
     assignment = db.relationship('Assignment', back_populates='journal_entries')
@@ -179,6 +391,21 @@ class JournalEntry(db.Model):
             'content': self.content
         }
 
+class IdempotencyKey(db.Model):
+    """Key and response of a write that may be sent again (offline outbox)"""
+    __tablename__ = 'idempotency_keys'
+    
+    key = db.Column(db.String(100), primary_key=True)
+    method = db.Column(db.String(10), nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    status_code = db.Column(db.Integer)  # Set once the response is known
+    response = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_idempotency_keys_created_at', 'created_at'),
+    )
+
 class Settings(db.Model):
     """System settings"""
     __tablename__ = 'settings'
@@ -0,0 +1,102 @@
+"""Scoping of requests to one of several concurrently active operations.
+
+Every list, stream and statistics path works on a single operation id and
+reads through the ``(operation_id, ...)`` indexes. Requests without an
+explicit ``operation_id`` fall back to the active operation only while
+there is exactly one; with several active operations the id is required.
+
+Each operation has a revision counter that is incremented in the same
+transaction as every change of its assignments, vehicle links or journal.
+Scoped lists carry the revision as ETag, so a client polling one operation
+gets a ``304`` without any list query as long as only other operations
+change.
+"""
+from flask import current_app, jsonify, request
+from app import db
+from models import Assignment, Operation, OperationRevision, OperationStatus, VehicleAssignment
+from datetime import datetime
+
+
+# Operations already touched in the current transaction (see sync.py)
+TOUCHED_KEY = 'touched_operations'
+
+
+class OperationScopeError(Exception):
+    """A request could not be resolved to a single operation"""
+
+
+class NoActiveOperation(OperationScopeError):
+    """No operation id given and no operation is active"""
+
+
+def active_operations():
+    """All active operations, newest first"""
+    return Operation.query.filter_by(status=OperationStatus.ACTIVE).order_by(Operation.created_at.desc()).all()
+
+
+def resolve_operation_id(operation_id=None):
+    """Operation id of a request: the given one or the only active operation"""
+    if operation_id:
+        try:
+            return int(operation_id)
+        except (TypeError, ValueError):
+            raise OperationScopeError('Invalid operation_id')
+
+    ids = [row[0] for row in db.session.query(Operation.id).filter_by(
+        status=OperationStatus.ACTIVE
+    ).order_by(Operation.created_at.desc()).limit(2).all()]
+    if not ids:
+        raise NoActiveOperation('No active operation found')
+    if len(ids) > 1:
+        raise OperationScopeError('Several operations are active, operation_id is required')
+    return ids[0]
+
+
+def touch(*operation_ids):
+    """Increment the revision of operations (flushed with the caller's transaction)"""
+    touched = db.session.info.setdefault(TOUCHED_KEY, set())
+    for operation_id in sorted({i for i in operation_ids if i is not None}):
+        touched.add(operation_id)
+        updated = OperationRevision.query.filter_by(operation_id=operation_id).update({
+            OperationRevision.revision: OperationRevision.revision + 1,
+            OperationRevision.updated_at: datetime.utcnow()
+        })
+        if not updated:
+            db.session.add(OperationRevision(operation_id=operation_id, revision=1))
+
+
+def vehicle_operations(vehicle_id):
+    """Ids of all operations with an assignment the vehicle is linked to"""
+    rows = db.session.query(Assignment.operation_id).join(VehicleAssignment).filter(
+        VehicleAssignment.vehicle_id == vehicle_id
+    ).distinct().all()
+    return [row[0] for row in rows]
+
+
+def get_revision(operation_id):
+    revision = db.session.get(OperationRevision, operation_id)
+    return revision.revision if revision else 0
+
+
+def get_revisions(operation_ids):
+    """Revision per operation id (0 for operations that never changed)"""
+    rows = db.session.query(OperationRevision.operation_id, OperationRevision.revision).filter(
+        OperationRevision.operation_id.in_(operation_ids)
+    ).all() if operation_ids else []
+    revisions = {operation_id: 0 for operation_id in operation_ids}
+    revisions.update(dict(rows))
+    return revisions
+
+
+def scoped_response(operation_id, kind, build):
+    """JSON response of ``build()``, skipped with 304 while the operation is unchanged"""
+    revision = get_revision(operation_id)
+    etag = f'{kind}-{operation_id}-{revision}'
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Operation-Revision'] = str(revision)
+    return response
@@ -0,0 +1,216 @@
+"""Incrementally maintained operation statistics.
+
+The counters in ``OperationStats`` are adjusted by the routes on every
+mutation, so reading them never has to touch the assignment tables.
+``rebuild_stats`` recomputes them with SQL aggregates; it is used when an
+operation is created and, at startup, for operations that existed before
+the counters were introduced.
+
+The age percentiles of open assignments need ranked lookups. Their result is
+cached per operation revision, so dashboard polls between two changes only
+read the revision row.
+"""
+from app import db
+from models import Assignment, AssignmentStatus, Operation, OperationStats, Vehicle, VehicleAssignment
+from datetime import datetime
+import db_routing
+import operation_scope
+
+STATUS_COUNTERS = {
+    AssignmentStatus.OPEN: OperationStats.open_count,
+    AssignmentStatus.ASSIGNED: OperationStats.assigned_count,
+    AssignmentStatus.COMPLETED: OperationStats.completed_count,
+}
+
+AGE_PERCENTILES = (50, 90, 99)
+AGE_CACHE_SIZE = 1024
+
+# operation_id -> (revision, {'p50': created_at, ..., 'max': created_at})
+_age_cache = {}
+
+
+def _adjust(operation_id, **deltas):
+    """Atomically add the given deltas to the counters of an operation"""
+    values = {getattr(OperationStats, name): getattr(OperationStats, name) + delta
+              for name, delta in deltas.items() if delta}
+    if not values:
+        return
+    values[OperationStats.updated_at] = datetime.utcnow()
+    updated = OperationStats.query.filter_by(operation_id=operation_id).update(values)
+    if not updated:
+        # No counter row yet - a fresh rebuild already reflects the flushed mutation
+        rebuild_stats(operation_id)
+
+
+def _active_links(operation_id, vehicle_id):
+    """Number of non-completed assignments of an operation a vehicle is on"""
+    return db.session.query(db.func.count(VehicleAssignment.id)).join(Assignment).filter(
+        VehicleAssignment.vehicle_id == vehicle_id,
+        Assignment.operation_id == operation_id,
+        Assignment.status != AssignmentStatus.COMPLETED
+    ).scalar()
+
+
+def _committed_operations(vehicle_id):
+    """Ids of all operations the vehicle is currently committed to"""
+    rows = db.session.query(Assignment.operation_id).join(VehicleAssignment).filter(
+        VehicleAssignment.vehicle_id == vehicle_id,
+        Assignment.status != AssignmentStatus.COMPLETED
+    ).distinct().all()
+    return [row[0] for row in rows]
+
+
+def rebuild_stats(operation_id):
+    """Recompute all counters of an operation from the raw tables"""
+    status_rows = db.session.query(Assignment.status, db.func.count(Assignment.id)).filter(
+        Assignment.operation_id == operation_id
+    ).group_by(Assignment.status).all()
+    by_status = {status: count for status, count in status_rows}
+
+    committed = db.session.query(VehicleAssignment.vehicle_id).join(Assignment).filter(
+        Assignment.operation_id == operation_id,
+        Assignment.status != AssignmentStatus.COMPLETED
+    ).distinct().subquery()
+    vehicle_count, personnel_count = db.session.query(
+        db.func.count(Vehicle.id),
+        db.func.coalesce(db.func.sum(Vehicle.crew_count), 0)
+    ).filter(Vehicle.id.in_(db.select(committed))).one()
+
+    stats = db.session.get(OperationStats, operation_id)
+    if stats is None:
+        stats = OperationStats(operation_id=operation_id)
+        db.session.add(stats)
+    stats.open_count = by_status.get(AssignmentStatus.OPEN, 0)
+    stats.assigned_count = by_status.get(AssignmentStatus.ASSIGNED, 0)
+    stats.completed_count = by_status.get(AssignmentStatus.COMPLETED, 0)
+    stats.vehicle_count = vehicle_count
+    stats.personnel_count = personnel_count
+    stats.updated_at = datetime.utcnow()
+    db.session.flush()
+    return stats
+
+
+def rebuild_missing_stats():
+    """Build counter rows for all operations that do not have one yet"""
+    missing = db.session.query(Operation.id).outerjoin(
+        OperationStats, OperationStats.operation_id == Operation.id
+    ).filter(OperationStats.operation_id.is_(None)).all()
+    for (operation_id,) in missing:
+        rebuild_stats(operation_id)
+    db.session.commit()
+
+
+def get_stats(operation_id):
+    """Get the counter row of an operation, building it on first access"""
+    stats = db.session.get(OperationStats, operation_id)
+    if stats is None:
+        # A lagging replica may miss the row; look again and build it on the primary
+        db_routing.use_primary()
+        stats = db.session.get(OperationStats, operation_id) or rebuild_stats(operation_id)
+    return stats
+
+
+def _open_created_at(operation_id, open_count):
+    """created_at of the open assignment at each age percentile rank"""
+    def created_at_rank(rank):
+        return db.session.query(Assignment.created_at).filter(
+            Assignment.operation_id == operation_id,
+            Assignment.status == AssignmentStatus.OPEN
+        ).order_by(Assignment.created_at).offset(rank).limit(1).scalar()
+
+    # Older assignments have larger ages, so the p-th age percentile is the
+    # (100 - p)-th percentile of created_at in ascending order
+    ranks = {f'p{p}': int(round((100 - p) / 100 * (open_count - 1))) for p in AGE_PERCENTILES}
+    ranks['max'] = 0
+    return {key: created_at_rank(rank) for key, rank in ranks.items()}
+
+
+def open_assignment_ages(operation_id, open_count, now=None):
+    """Age percentiles (in seconds) of the open assignments of an operation.
+
+    The ranked ``ORDER BY created_at OFFSET k`` lookups grow with the number
+    of open assignments, so they only run once per operation revision; until
+    the next change the ages are derived from the cached timestamps.
+    """
+    now = now or datetime.utcnow()
+    if not open_count:
+        return {key: None for key in [f'p{p}' for p in AGE_PERCENTILES] + ['max']}
+
+    revision = operation_scope.get_revision(operation_id)
+    cached = _age_cache.get(operation_id)
+    if cached is not None and cached[0] == revision:
+        created = cached[1]
+    else:
+        created = _open_created_at(operation_id, open_count)
+        if len(_age_cache) >= AGE_CACHE_SIZE:
+            _age_cache.clear()
+        _age_cache[operation_id] = (revision, created)
+    return {key: (now - created_at).total_seconds() if created_at else None
+            for key, created_at in created.items()}
+
+
+def assignment_created(assignment):
+    """Count a newly created assignment"""
+    counter = STATUS_COUNTERS[assignment.status].key
+    _adjust(assignment.operation_id, **{counter: 1})
+
+
+def assignment_status_changed(assignment, old_status):
+    """Move an assignment between status counters and release/commit its vehicles"""
+    if old_status == assignment.status:
+        return
+    db.session.flush()
+    deltas = {
+        STATUS_COUNTERS[old_status].key: -1,
+        STATUS_COUNTERS[assignment.status].key: 1,
+    }
+
+    was_active = old_status != AssignmentStatus.COMPLETED
+    is_active = assignment.status != AssignmentStatus.COMPLETED
+    if was_active != is_active:
+        sign = 1 if is_active else -1
+        vehicle_delta = 0
+        crew_delta = 0
+        for va in assignment.vehicle_assignments:
+            # Committed before/after means exactly this link toggles the vehicle
+            links = _active_links(assignment.operation_id, va.vehicle_id)
+            if (is_active and links == 1) or (not is_active and links == 0):
+                vehicle_delta += sign
+                crew_delta += sign * (va.vehicle.crew_count or 0)
+        deltas['vehicle_count'] = vehicle_delta
+        deltas['personnel_count'] = crew_delta
+
+    _adjust(assignment.operation_id, **deltas)
+
+
+def vehicle_committed(assignment, vehicle):
+    """Account for a vehicle that was just added to an assignment"""
+    if assignment.status == AssignmentStatus.COMPLETED:
+        return
+    db.session.flush()
+    if _active_links(assignment.operation_id, vehicle.id) == 1:
+        _adjust(assignment.operation_id, vehicle_count=1, personnel_count=vehicle.crew_count or 0)
+
+
+def vehicle_released(assignment, vehicle):
+    """Account for a vehicle that was just removed from an assignment"""
+    if assignment.status == AssignmentStatus.COMPLETED:
+        return
+    db.session.flush()
+    if _active_links(assignment.operation_id, vehicle.id) == 0:
+        _adjust(assignment.operation_id, vehicle_count=-1, personnel_count=-(vehicle.crew_count or 0))
+
+
+def vehicle_crew_changed(vehicle, old_crew_count):
+    """Propagate a changed crew size to every operation the vehicle is committed to"""
+    delta = (vehicle.crew_count or 0) - (old_crew_count or 0)
+    if not delta:
+        return
+    for operation_id in _committed_operations(vehicle.id):
+        _adjust(operation_id, personnel_count=delta)
+
+
+def vehicle_deleted(vehicle):
+    """Release a vehicle from all operations before it is deleted"""
+    for operation_id in _committed_operations(vehicle.id):
+        _adjust(operation_id, vehicle_count=-1, personnel_count=-(vehicle.crew_count or 0))
@@ -0,0 +1,191 @@
+"""Rate limiting and backpressure for the external API.
+
+Every API key gets its own token bucket. Requests that pass the bucket enter
+a bounded intake: only a few external requests are processed at once so the
+remaining worker threads stay free for the dispatchers' own UI, a limited
+number may wait for a slot, and everything beyond that is rejected with
+``429 Too Many Requests`` and a ``Retry-After`` header instead of stalling.
+
+API keys are configured via ``API_KEYS`` as a comma separated list of
+``name:key[:rate[:burst]]`` entries (rate in requests per second). The
+legacy single ``API_KEY`` is still accepted as client ``default``.
+
+State is kept in memory and therefore per worker process.
+"""
+from contextlib import contextmanager
+import hmac
+import math
+import os
+import threading
+import time
+
+
+class RateLimited(Exception):
+    """Raised when a request has to be rejected; carries the Retry-After hint"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, at most ``burst`` stored"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self):
+        """Take one token; return 0 on success or the seconds until one is available"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate if self.rate > 0 else 60
+
+
+class ApiClient:
+    """An external system identified by its API key"""
+
+    def __init__(self, name, key, rate, burst):
+        self.name = name
+        self.key = key
+        self.bucket = TokenBucket(rate, burst)
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.rate_limited = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def count(self, counter):
+        """Increment one of the request counters (requests run in parallel threads)"""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'rate': self.bucket.rate,
+                'burst': self.bucket.burst,
+                'accepted': self.accepted,
+                'queued': self.queued,
+                'rate_limited': self.rate_limited,
+                'rejected': self.rejected
+            }
+
+
+class Intake:
+    """Bounded intake: ``max_concurrent`` in progress, ``max_queued`` waiting"""
+
+    def __init__(self, max_concurrent, max_queued, timeout):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.active = 0
+
+    @contextmanager
+    def admit(self, client):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.max_queued:
+                    client.count('rejected')
+                    raise RateLimited('Intake queue full', self.timeout)
+                self.waiting += 1
+            client.count('queued')
+            try:
+                acquired = self._slots.acquire(timeout=self.timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not acquired:
+                client.count('rejected')
+                raise RateLimited('Timed out waiting in intake queue', self.timeout)
+
+        with self._lock:
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+            self._slots.release()
+
+    def to_dict(self):
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_queued': self.max_queued,
+            'active': self.active,
+            'waiting': self.waiting
+        }
+
+
+class RateLimiter:
+    """Looks up API clients and admits their requests"""
+
+    def __init__(self, clients, intake):
+        self.clients = clients
+        self.intake = intake
+
+    def authenticate(self, api_key):
+        """Return the client for an API key, or None"""
+        if not api_key:
+            return None
+        # compare_digest only accepts ASCII str, header values may be any text
+        api_key = api_key.encode()
+        for client in self.clients:
+            if hmac.compare_digest(client.key.encode(), api_key):
+                return client
+        return None
+
+    @contextmanager
+    def admit(self, client):
+        """Apply the client's token bucket, then hold an intake slot"""
+        wait = client.bucket.consume()
+        if wait:
+            client.count('rate_limited')
+            raise RateLimited('Rate limit exceeded', wait)
+        with self.intake.admit(client):
+            client.count('accepted')
+            yield
+
+    def to_dict(self):
+        return {
+            'clients': [c.to_dict() for c in self.clients],
+            'intake': self.intake.to_dict()
+        }
+
+
+def load_from_env(environ=os.environ):
+    """Build a RateLimiter from the environment"""
+    default_rate = float(environ.get('API_RATE_LIMIT', 1.0))
+    default_burst = float(environ.get('API_RATE_BURST', 10))
+
+    clients = []
+    for entry in filter(None, (e.strip() for e in environ.get('API_KEYS', '').split(','))):
+        parts = entry.split(':')
+        if len(parts) < 2:
+            raise ValueError(f'Invalid API_KEYS entry: {entry!r}, expected name:key[:rate[:burst]]')
+        rate = float(parts[2]) if len(parts) > 2 and parts[2] else default_rate
+        burst = float(parts[3]) if len(parts) > 3 and parts[3] else default_burst
+        clients.append(ApiClient(parts[0], parts[1], rate, burst))
+    if not clients:
+        clients.append(ApiClient('default', environ.get('API_KEY', 'change-this-in-production'),
+                                 default_rate, default_burst))
+
+    intake = Intake(
+        max_concurrent=int(environ.get('API_MAX_CONCURRENT', 2)),
+        max_queued=int(environ.get('API_MAX_QUEUED', 10)),
+        timeout=float(environ.get('API_QUEUE_TIMEOUT', 5))
+    )
+    return RateLimiter(clients, intake)
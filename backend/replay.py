@@ -0,0 +1,259 @@
+"""Time-travel replay of operations.
+
+Every mutation of an operation is recorded as a structured ``OperationEvent``.
+After ``CHECKPOINT_INTERVAL`` events the complete state is stored as an
+``OperationCheckpoint``, so the state at any point in time is the nearest
+earlier checkpoint plus a short run of events instead of a rescan of the
+whole history.
+
+Events are applied in id order. Timestamps of concurrent requests can commit
+out of order, so a checkpoint covers all events up to ``last_event_id`` and
+its ``timestamp`` is the latest timestamp among them; it is only used for
+points in time at or after that.
+
+The replay state looks like::
+
+    {'status': 'active',
+     'assignments': {'<id>': {'number': ..., 'title': ..., 'status': ...,
+                              'latitude': ..., 'longitude': ...,
+                              'vehicles': [{'vehicle_id': 1, 'callsign': '...'}]}}}
+"""
+from app import db
+from models import Assignment, Operation, OperationCheckpoint, OperationEvent, VehicleAssignment
+from datetime import datetime, timedelta, timezone
+import copy
+import math
+import os
+
+CHECKPOINT_INTERVAL = int(os.environ.get('REPLAY_CHECKPOINT_INTERVAL', 50))
+MAX_FRAMES = 500
+MAX_STEP = 86400  # seconds
+
+ASSIGNMENT_FIELDS = ('number', 'title', 'location_address', 'latitude', 'longitude', 'status')
+
+
+def empty_state():
+    return {'status': 'active', 'assignments': {}}
+
+
+def apply_event(state, event):
+    """Apply a single event to a replay state in place"""
+    data = event.data or {}
+    key = str(event.assignment_id) if event.assignment_id is not None else None
+    assignments = state['assignments']
+
+    if event.event_type == 'assignment_created':
+        assignments[key] = {field: data.get(field) for field in ASSIGNMENT_FIELDS}
+        assignments[key]['vehicles'] = []
+    elif event.event_type in ('assignment_updated', 'assignment_status') and key in assignments:
+        assignments[key].update({k: v for k, v in data.items() if k in ASSIGNMENT_FIELDS})
+    elif event.event_type == 'vehicle_assigned' and key in assignments:
+        vehicles = assignments[key]['vehicles']
+        if not any(v['vehicle_id'] == event.vehicle_id for v in vehicles):
+            vehicles.append({'vehicle_id': event.vehicle_id, 'callsign': data.get('callsign')})
+    elif event.event_type == 'vehicle_unassigned' and key in assignments:
+        assignments[key]['vehicles'] = [v for v in assignments[key]['vehicles']
+                                        if v['vehicle_id'] != event.vehicle_id]
+    elif event.event_type == 'operation_closed':
+        state['status'] = 'closed'
+    return state
+
+
+def _after(checkpoint):
+    """Filter for events that are not contained in a checkpoint"""
+    if checkpoint is None:
+        return db.true()
+    return OperationEvent.id > checkpoint.last_event_id
+
+
+def _latest_checkpoint(operation_id, at=None):
+    query = OperationCheckpoint.query.filter_by(operation_id=operation_id)
+    if at is not None:
+        query = query.filter(OperationCheckpoint.timestamp <= at)
+    return query.order_by(OperationCheckpoint.last_event_id.desc()).first()
+
+
+def _events(operation_id, checkpoint, until=None):
+    query = OperationEvent.query.filter(OperationEvent.operation_id == operation_id, _after(checkpoint))
+    if until is not None:
+        query = query.filter(OperationEvent.timestamp <= until)
+    return query.order_by(OperationEvent.id)
+
+
+def state_at(operation_id, at):
+    """Reconstruct the state of an operation at a point in time"""
+    checkpoint = _latest_checkpoint(operation_id, at)
+    state = copy.deepcopy(checkpoint.state) if checkpoint else empty_state()
+    for event in _events(operation_id, checkpoint, at):
+        apply_event(state, event)
+    return state
+
+
+def frames(operation_id, start, end, step):
+    """States at ``start``, ``start + step``, ... up to ``end`` in one pass over the events"""
+    checkpoint = _latest_checkpoint(operation_id, start)
+    state = copy.deepcopy(checkpoint.state) if checkpoint else empty_state()
+    events = sorted(_events(operation_id, checkpoint, end).all(), key=lambda e: (e.timestamp, e.id))
+    position = 0
+
+    result = []
+    at = start
+    while at <= end and len(result) < MAX_FRAMES:
+        due = []
+        while position < len(events) and events[position].timestamp <= at:
+            due.append(events[position])
+            position += 1
+        # Same order as state_at within a frame
+        for event in sorted(due, key=lambda e: e.id):
+            apply_event(state, event)
+        result.append({'at': at.isoformat(), 'state': copy.deepcopy(state)})
+        at += step
+    return result
+
+
+def _maybe_checkpoint(operation_id):
+    """Store a checkpoint once enough events accumulated since the last one"""
+    checkpoint = _latest_checkpoint(operation_id)
+    if _events(operation_id, checkpoint).count() < CHECKPOINT_INTERVAL:
+        return
+    pending = _events(operation_id, checkpoint).all()
+    state = copy.deepcopy(checkpoint.state) if checkpoint else empty_state()
+    latest = checkpoint.timestamp if checkpoint else pending[0].timestamp
+    for event in pending:
+        apply_event(state, event)
+        latest = max(latest, event.timestamp)
+    db.session.add(OperationCheckpoint(
+        operation_id=operation_id,
+        timestamp=latest,
+        last_event_id=pending[-1].id,
+        state=state
+    ))
+
+
+def record(operation_id, event_type, assignment_id=None, vehicle_id=None, timestamp=None, checkpoint=True, **data):
+    """Record a change event (flushed with the caller's transaction)"""
+    event = OperationEvent(
+        operation_id=operation_id,
+        timestamp=timestamp or datetime.utcnow(),
+        event_type=event_type,
+        assignment_id=assignment_id,
+        vehicle_id=vehicle_id,
+        data=data or None
+    )
+    db.session.add(event)
+    db.session.flush()
+    if checkpoint:
+        _maybe_checkpoint(operation_id)
+    return event
+
+
+def assignment_snapshot(assignment):
+    """Replay fields of an assignment"""
+    return {
+        'number': assignment.number,
+        'title': assignment.title,
+        'location_address': assignment.location_address,
+        'latitude': assignment.latitude,
+        'longitude': assignment.longitude,
+        'status': assignment.status.value
+    }
+
+
+def rebuild_operation(operation):
+    """Synthesize events for an operation from its current rows.
+
+    Used for operations recorded before replay existed. Vehicles that were
+    removed from an assignment in the meantime cannot be recovered.
+    """
+    OperationCheckpoint.query.filter_by(operation_id=operation.id).delete()
+    OperationEvent.query.filter_by(operation_id=operation.id).delete()
+
+    # Collected first and recorded by timestamp, so the event ids follow the time
+    events = []
+    for assignment in Assignment.query.filter_by(operation_id=operation.id).order_by(Assignment.created_at).all():
+        snapshot = assignment_snapshot(assignment)
+        snapshot['status'] = 'open'
+        events.append((assignment.created_at, 'assignment_created', assignment.id, None, snapshot))
+        links = VehicleAssignment.query.filter_by(assignment_id=assignment.id).order_by(VehicleAssignment.assigned_at).all()
+        for index, va in enumerate(links):
+            assigned_at = va.assigned_at or assignment.created_at
+            events.append((assigned_at, 'vehicle_assigned', assignment.id, va.vehicle_id,
+                           {'callsign': va.vehicle.callsign}))
+            if index == 0:
+                events.append((assigned_at, 'assignment_status', assignment.id, None, {'status': 'assigned'}))
+        if assignment.completed_at:
+            events.append((assignment.completed_at, 'assignment_status', assignment.id, None,
+                           {'status': 'completed'}))
+    if operation.closed_at:
+        events.append((operation.closed_at, 'operation_closed', None, None, {}))
+    events.sort(key=lambda event: event[0])
+    for timestamp, event_type, assignment_id, vehicle_id, data in events:
+        record(operation.id, event_type, assignment_id, vehicle_id, timestamp=timestamp, checkpoint=False, **data)
+
+    # Checkpoints every CHECKPOINT_INTERVAL events
+    state = empty_state()
+    for index, event in enumerate(_events(operation.id, None).all(), start=1):
+        apply_event(state, event)
+        if index % CHECKPOINT_INTERVAL == 0:
+            db.session.add(OperationCheckpoint(operation_id=operation.id, timestamp=event.timestamp,
+                                               last_event_id=event.id, state=copy.deepcopy(state)))
+    db.session.flush()
+
+
+def backfill_checkpoint_timestamps():
+    """Set checkpoint timestamps to the latest timestamp of the events they contain"""
+    latest = db.select(db.func.max(OperationEvent.timestamp)).where(
+        OperationEvent.operation_id == OperationCheckpoint.operation_id,
+        OperationEvent.id <= OperationCheckpoint.last_event_id
+    ).scalar_subquery()
+    OperationCheckpoint.query.update(
+        {OperationCheckpoint.timestamp: db.func.coalesce(latest, OperationCheckpoint.timestamp)},
+        synchronize_session=False
+    )
+
+
+def _incomplete_operations():
+    """Ids of operations without events or with assignments whose creation was not recorded"""
+    created = db.select(OperationEvent.id).where(
+        OperationEvent.operation_id == Assignment.operation_id,
+        OperationEvent.assignment_id == Assignment.id,
+        OperationEvent.event_type == 'assignment_created'
+    ).exists()
+    partial = db.session.query(Assignment.operation_id).filter(~created).distinct()
+    recorded = db.select(OperationEvent.id).where(OperationEvent.operation_id == Operation.id).exists()
+    empty = db.session.query(Operation.id).filter(~recorded)
+    return {row[0] for row in partial.union(empty)}
+
+
+def rebuild_all(only_missing=True):
+    """Synthesize replay events for operations (by default only those with a missing or partial history)"""
+    incomplete = _incomplete_operations() if only_missing else None
+    count = 0
+    for operation in Operation.query.order_by(Operation.id).all():
+        if only_missing and operation.id not in incomplete:
+            continue
+        rebuild_operation(operation)
+        count += 1
+    db.session.commit()
+    return count
+
+
+def parse_timestamp(value):
+    """Parse an ISO timestamp into naive UTC as stored in the database"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_step(value, default=60):
+    """Frame step in seconds (1 to ``MAX_STEP``)"""
+    seconds = float(value or default)
+    if not math.isfinite(seconds) or seconds > MAX_STEP:
+        raise ValueError(f'step must be at most {MAX_STEP} seconds')
+    return timedelta(seconds=max(seconds, 1))
+
+
+def frame_count(start, end, step):
+    """Number of frames between ``start`` and ``end``"""
+    return int((end - start) / step) + 1 if end >= start else 0
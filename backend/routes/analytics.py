@@ -0,0 +1,60 @@
+from flask import Blueprint, request, jsonify
+from datetime import date
+import analytics
+
+bp = Blueprint('analytics', __name__, url_prefix='/api/analytics')
+
+def parse_range():
+    """Parse the optional from/to query parameters (YYYY-MM-DD)"""
+    start = request.args.get('from')
+    end = request.args.get('to')
+    return (date.fromisoformat(start) if start else None,
+            date.fromisoformat(end) if end else None)
+
+def invalid_range():
+    return jsonify({'error': 'Invalid date, expected YYYY-MM-DD'}), 400
+
+@bp.route('/summary', methods=['GET'])
+def get_summary():
+    """Get response metrics summed over a date range"""
+    try:
+        start, end = parse_range()
+    except ValueError:
+        return invalid_range()
+    return jsonify(analytics.summary(start, end))
+
+@bp.route('/daily', methods=['GET'])
+def get_daily():
+    """Get response metrics per day"""
+    try:
+        start, end = parse_range()
+    except ValueError:
+        return invalid_range()
+    return jsonify(analytics.daily(start, end))
+
+@bp.route('/operations', methods=['GET'])
+def get_operations():
+    """Get response metrics per operation"""
+    try:
+        start, end = parse_range()
+    except ValueError:
+        return invalid_range()
+    return jsonify(analytics.operations(start, end))
+
+@bp.route('/vehicles', methods=['GET'])
+def get_vehicles():
+    """Get assignments and utilisation hours per vehicle"""
+    try:
+        start, end = parse_range()
+    except ValueError:
+        return invalid_range()
+    return jsonify(analytics.vehicles(start, end))
+
+@bp.route('/stations', methods=['GET'])
+def get_stations():
+    """Get assignments and utilisation hours per station"""
+    try:
+        start, end = parse_range()
+    except ValueError:
+        return invalid_range()
+    return jsonify(analytics.stations(start, end))
@@ -1,19 +1,55 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, g, current_app
 from functools import wraps
+import hmac
 import os
+import rate_limit
+import vehicle_status
 
 bp = Blueprint('api_external', __name__, url_prefix='/api/external')
 
-# Simple API key authentication
+# Per-key token buckets and bounded intake, built on first use
+_limiter = None
+
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        _limiter = rate_limit.load_from_env()
+    return _limiter
+
+# API key authentication with per-key rate limiting
 def require_api_key(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        limiter = get_limiter()
+        client = limiter.authenticate(request.headers.get('X-API-Key'))
+
+        if not client:
+            return jsonify({'error': 'Invalid or missing API key'}), 401
+
+        g.api_client = client
+        try:
+            with limiter.admit(client):
+                return f(*args, **kwargs)
+        except rate_limit.RateLimited as e:
+            response = jsonify({'error': e.reason, 'retry_after': e.retry_after})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+    return decorated_function
+
+# Monitoring key: METRICS_API_KEY if set, otherwise any client key (without using up its rate limit)
+def require_metrics_key(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         api_key = request.headers.get('X-API-Key')
-        expected_key = os.environ.get('API_KEY', 'change-this-in-production')
+        metrics_key = os.environ.get('METRICS_API_KEY')
+        if metrics_key:
+            allowed = bool(api_key) and hmac.compare_digest(metrics_key.encode(), api_key.encode())
+        else:
+            allowed = get_limiter().authenticate(api_key) is not None
         
-        if not api_key or api_key != expected_key:
+        if not allowed:
             return jsonify({'error': 'Invalid or missing API key'}), 401
-        
         return f(*args, **kwargs)
     return decorated_function
 
@@ -24,7 +60,31 @@ def create_assignment_external():
     from routes.assignments import create_assignment
     return create_assignment()
 
+@bp.route('/status', methods=['POST'])
+@require_api_key
+def ingest_vehicle_status():
+    """Accept FMS status telegrams (single object, list or {"telegrams": [...]})"""
+    try:
+        telegrams = vehicle_status.parse_telegrams(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    board = vehicle_status.get_board(current_app._get_current_object())
+    accepted, errors = board.ingest(telegrams, source=g.api_client.name)
+    
+    if not accepted and errors:
+        return jsonify({'accepted': 0, 'errors': errors}), 400
+    return jsonify({'accepted': accepted, 'errors': errors}), 202
+
 @bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'ok'}), 200
+
+@bp.route('/metrics', methods=['GET'])
+@require_metrics_key
+def metrics():
+    """Accepted, queued and rejected requests per API client, status ingestion"""
+    result = get_limiter().to_dict()
+    result['vehicle_status'] = vehicle_status.get_board(current_app._get_current_object()).to_dict()
+    return jsonify(result), 200
@@ -2,42 +2,50 @@ from flask import Blueprint, request, jsonify
 from app import db
 from models import Assignment, Operation, VehicleAssignment, Vehicle, JournalEntry, AssignmentStatus, OperationStatus
 from datetime import datetime
-from geopy.geocoders import Nominatim
 from sqlalchemy import desc
 import os
+import operation_stats
+import analytics
+import spatial_index
+import replay
+import geocoding
+import operation_scope
 
 bp = Blueprint('assignments', __name__, url_prefix='/api/assignments')
-geolocator = Nominatim(user_agent="tel-system")
 
 @bp.route('/', methods=['GET'])
 def get_assignments():
-    """Get all assignments for active operation"""
-    operation_id = request.args.get('operation_id')
-    
-    if operation_id:
-        assignments = Assignment.query.filter_by(operation_id=operation_id).all()
-    else:
-        # Get active operation
-        operation = Operation.query.filter_by(status=OperationStatus.ACTIVE).first()
-        if operation:
-            assignments = Assignment.query.filter_by(operation_id=operation.id).all()
-        else:
-            assignments = []
-    
-    return jsonify([a.to_dict() for a in assignments])
+    """Get all assignments of an operation (default: the only active one)"""
+    try:
+        operation_id = operation_scope.resolve_operation_id(request.args.get('operation_id'))
+    except operation_scope.NoActiveOperation:
+        return jsonify([])
+    except operation_scope.OperationScopeError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def build():
+        assignments = Assignment.query.filter_by(operation_id=operation_id).options(
+            db.selectinload(Assignment.vehicle_assignments).joinedload(VehicleAssignment.vehicle)
+        ).order_by(Assignment.created_at).all()
+        return [a.to_dict() for a in assignments]
+    return operation_scope.scoped_response(operation_id, 'assignments', build)
 
 @bp.route('/', methods=['POST'])
 def create_assignment():
     """Create a new assignment"""
     data = request.json
     
-    # Get or create active operation
-    operation_id = data.get('operation_id')
-    if not operation_id:
-        operation = Operation.query.filter_by(status=OperationStatus.ACTIVE).first()
-        if not operation:
-            return jsonify({'error': 'No active operation found'}), 400
-        operation_id = operation.id
+    # Explicit operation or the only active one
+    try:
+        operation_id = operation_scope.resolve_operation_id(data.get('operation_id'))
+    except operation_scope.OperationScopeError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    operation = Operation.query.get(operation_id)
+    if not operation:
+        return jsonify({'error': 'Operation not found'}), 404
+    if operation.status == OperationStatus.CLOSED:
+        return jsonify({'error': 'Cannot add assignment to closed operation'}), 400
     
     # Generate assignment number
     last_assignment = Assignment.query.filter_by(
@@ -50,7 +58,6 @@ def create_assignment():
     else:
         new_num = 1
     
-    operation = Operation.query.get(operation_id)
     assignment_number = f"{operation.number}-{new_num:03d}"
     
     assignment = Assignment(
@@ -69,7 +76,7 @@ def create_assignment():
     elif data.get('location_address'):
         # Try to geocode
         try:
-            geo_result = geolocator.geocode(data['location_address'])
+            geo_result = geocoding.geocode(data['location_address'])
             if geo_result:
                 assignment.latitude = geo_result.latitude
                 assignment.longitude = geo_result.longitude
@@ -77,7 +84,12 @@ def create_assignment():
             print(f"Geocoding error: {e}")
     
     db.session.add(assignment)
-    db.session.commit()
+    # Id and created_at for the counters and replay, committed together below
+    db.session.flush()
+    
+    operation_stats.assignment_created(assignment)
+    replay.record(operation_id, 'assignment_created', assignment.id, timestamp=assignment.created_at,
+                  **replay.assignment_snapshot(assignment))
     
     # Create journal entry
     journal_entry = JournalEntry(
@@ -87,6 +99,7 @@ def create_assignment():
         content=f'Auftrag {assignment.number} erstellt: {assignment.title}'
     )
     db.session.add(journal_entry)
+    operation_scope.touch(operation_id)
     db.session.commit()
     
     return jsonify(assignment.to_dict()), 201
@@ -97,6 +110,54 @@ def get_assignment(assignment_id):
     assignment = Assignment.query.get_or_404(assignment_id)
     return jsonify(assignment.to_dict())
 
+def parse_suggestion_filters(data):
+    """Read vehicle_type (comma separated or list) and limit from request data"""
+    vehicle_types = data.get('vehicle_type')
+    if isinstance(vehicle_types, str):
+        vehicle_types = [t.strip() for t in vehicle_types.split(',') if t.strip()]
+    elif isinstance(vehicle_types, list):
+        vehicle_types = [t for t in vehicle_types if isinstance(t, str)]
+    else:
+        vehicle_types = None
+    try:
+        limit = max(1, min(int(data.get('limit', 10)), 100))
+    except (TypeError, ValueError):
+        limit = 10
+    return vehicle_types or None, limit
+
+@bp.route('/<int:assignment_id>/suggestions', methods=['GET'])
+def get_vehicle_suggestions(assignment_id):
+    """Get free vehicles ranked by distance of their station"""
+    assignment = Assignment.query.get_or_404(assignment_id)
+    vehicle_types, limit = parse_suggestion_filters(request.args)
+    
+    suggestions = spatial_index.suggest_vehicles([assignment], vehicle_types, limit)
+    return jsonify(suggestions[assignment.id])
+
+@bp.route('/suggestions', methods=['POST'])
+def get_vehicle_suggestions_batch():
+    """Get vehicle suggestions for several assignments in one call (exclusive: no vehicle twice)"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'JSON object expected'}), 400
+    assignment_ids = data.get('assignment_ids')
+    
+    if not assignment_ids:
+        return jsonify({'error': 'assignment_ids is required'}), 400
+    if not isinstance(assignment_ids, list) or \
+            not all(isinstance(i, int) and not isinstance(i, bool) for i in assignment_ids):
+        return jsonify({'error': 'assignment_ids must be a list of ids'}), 400
+    
+    vehicle_types, limit = parse_suggestion_filters(data)
+    assignments = Assignment.query.filter(Assignment.id.in_(assignment_ids)).all()
+    # Exclusive suggestions go to the assignments in the order requested
+    position = {assignment_id: i for i, assignment_id in reversed(list(enumerate(assignment_ids)))}
+    assignments.sort(key=lambda a: position[a.id])
+    
+    suggestions = spatial_index.suggest_vehicles(assignments, vehicle_types, limit,
+                                                 exclusive=bool(data.get('exclusive')))
+    return jsonify({str(assignment_id): vehicles for assignment_id, vehicles in suggestions.items()})
+
 @bp.route('/<int:assignment_id>', methods=['PUT'])
 def update_assignment(assignment_id):
     """Update an assignment"""
@@ -116,7 +177,7 @@ def update_assignment(assignment_id):
         assignment.location_address = data['location_address']
         # Re-geocode
         try:
-            geo_result = geolocator.geocode(data['location_address'])
+            geo_result = geocoding.geocode(data['location_address'])
             if geo_result:
                 assignment.latitude = geo_result.latitude
                 assignment.longitude = geo_result.longitude
@@ -127,6 +188,10 @@ def update_assignment(assignment_id):
     if 'longitude' in data:
         assignment.longitude = data['longitude']
     
+    operation_scope.touch(assignment.operation_id)
+    replay.record(assignment.operation_id, 'assignment_updated', assignment.id,
+                  **replay.assignment_snapshot(assignment))
+    
     db.session.commit()
     return jsonify(assignment.to_dict())
 
@@ -137,9 +202,18 @@ def complete_assignment(assignment_id):
     
     if assignment.operation.status == OperationStatus.CLOSED:
         return jsonify({'error': 'Cannot modify assignment in closed operation'}), 400
+    # The rollups are based on the first completion
+    if assignment.status == AssignmentStatus.COMPLETED:
+        return jsonify({'error': 'Assignment is already completed'}), 400
     
+    old_status = assignment.status
     assignment.status = AssignmentStatus.COMPLETED
     assignment.completed_at = datetime.utcnow()
+    operation_stats.assignment_status_changed(assignment, old_status)
+    operation_scope.touch(assignment.operation_id)
+    analytics.record_assignment_completed(assignment)
+    replay.record(assignment.operation_id, 'assignment_status', assignment.id,
+                  timestamp=assignment.completed_at, status=assignment.status.value)
     
     # Create journal entry
     journal_entry = JournalEntry(
@@ -165,6 +239,10 @@ def assign_vehicle(assignment_id):
     
     vehicle = Vehicle.query.get_or_404(vehicle_id)
     
+    # Its vehicle times were folded into the rollups at completion
+    if assignment.status == AssignmentStatus.COMPLETED:
+        return jsonify({'error': 'Cannot assign vehicles to a completed assignment'}), 400
+    
     # Check if vehicle is already assigned to this assignment
     existing = VehicleAssignment.query.filter_by(
         vehicle_id=vehicle_id,
@@ -174,22 +252,34 @@ def assign_vehicle(assignment_id):
     if existing:
         return jsonify({'error': 'Vehicle already assigned to this assignment'}), 400
     
-    # Get the max order for this vehicle
-    max_order = db.session.query(db.func.max(VehicleAssignment.order)).filter_by(
-        vehicle_id=vehicle_id
+    # Get the max order for this vehicle within the operation
+    max_order = db.session.query(db.func.max(VehicleAssignment.order)).join(Assignment).filter(
+        VehicleAssignment.vehicle_id == vehicle_id,
+        Assignment.operation_id == assignment.operation_id
     ).scalar() or 0
     
     vehicle_assignment = VehicleAssignment(
         vehicle_id=vehicle_id,
         assignment_id=assignment_id,
-        order=max_order + 1
+        order=max_order + 1,
+        assigned_at=datetime.utcnow()
     )
     
     db.session.add(vehicle_assignment)
+    analytics.record_vehicle_assigned(assignment, vehicle_assignment)
     
     # Update assignment status if it was open
+    old_status = assignment.status
     if assignment.status == AssignmentStatus.OPEN:
         assignment.status = AssignmentStatus.ASSIGNED
+    operation_stats.assignment_status_changed(assignment, old_status)
+    operation_stats.vehicle_committed(assignment, vehicle)
+    operation_scope.touch(assignment.operation_id)
+    replay.record(assignment.operation_id, 'vehicle_assigned', assignment.id, vehicle.id,
+                  timestamp=vehicle_assignment.assigned_at, callsign=vehicle.callsign)
+    if assignment.status != old_status:
+        replay.record(assignment.operation_id, 'assignment_status', assignment.id,
+                      status=assignment.status.value)
     
     # Create journal entry
     journal_entry = JournalEntry(
@@ -217,10 +307,22 @@ def unassign_vehicle(assignment_id, vehicle_id):
     
     db.session.delete(vehicle_assignment)
     
+    operation_stats.vehicle_released(assignment, vehicle)
+    released_at = datetime.utcnow()
+    analytics.record_vehicle_released(assignment, vehicle_assignment, vehicle, released_at)
+    
     # Check if assignment has any more vehicles
     remaining = VehicleAssignment.query.filter_by(assignment_id=assignment_id).count()
+    old_status = assignment.status
     if remaining == 0 and assignment.status == AssignmentStatus.ASSIGNED:
         assignment.status = AssignmentStatus.OPEN
+    operation_stats.assignment_status_changed(assignment, old_status)
+    operation_scope.touch(assignment.operation_id)
+    replay.record(assignment.operation_id, 'vehicle_unassigned', assignment.id, vehicle.id,
+                  timestamp=released_at, callsign=vehicle.callsign)
+    if assignment.status != old_status:
+        replay.record(assignment.operation_id, 'assignment_status', assignment.id,
+                      status=assignment.status.value)
     
     # Create journal entry
     journal_entry = JournalEntry(
@@ -258,6 +360,7 @@ def upload_pdf():
         file.save(filepath)
         
         assignment.pdf_file = filename
+        operation_scope.touch(assignment.operation_id)
         db.session.commit()
         
         return jsonify({'filename': filename}), 200
@@ -3,6 +3,7 @@ from app import db
 from models import JournalEntry, Operation, Assignment, OperationStatus
 from datetime import datetime
 from sqlalchemy import desc
+import operation_scope
 
 bp = Blueprint('journal', __name__, url_prefix='/api/journal')
 
@@ -12,37 +13,40 @@ def get_journal_entries():
     operation_id = request.args.get('operation_id')
     assignment_id = request.args.get('assignment_id')
     
-    query = JournalEntry.query
+    if assignment_id and not operation_id:
+        assignment = Assignment.query.get_or_404(assignment_id)
+        operation_id = assignment.operation_id
     
-    if operation_id:
-        query = query.filter_by(operation_id=operation_id)
-    elif assignment_id:
-        query = query.filter_by(assignment_id=assignment_id)
-    else:
-        # Get active operation
-        operation = Operation.query.filter_by(status=OperationStatus.ACTIVE).first()
-        if operation:
-            query = query.filter_by(operation_id=operation.id)
-        else:
-            return jsonify([])
+    try:
+        operation_id = operation_scope.resolve_operation_id(operation_id)
+    except operation_scope.NoActiveOperation:
+        return jsonify([])
+    except operation_scope.OperationScopeError as e:
+        return jsonify({'error': str(e)}), 400
     
-    entries = query.order_by(JournalEntry.timestamp).all()
-    return jsonify([e.to_dict() for e in entries])
+    def build():
+        query = JournalEntry.query.filter_by(operation_id=operation_id)
+        if assignment_id:
+            query = query.filter_by(assignment_id=assignment_id)
+        entries = query.order_by(JournalEntry.timestamp).all()
+        return [e.to_dict() for e in entries]
+    kind = f'journal-a{assignment_id}' if assignment_id else 'journal'
+    return operation_scope.scoped_response(operation_id, kind, build)
 
 @bp.route('/', methods=['POST'])
 def create_journal_entry():
     """Create a new journal entry"""
     data = request.json
     
-    operation_id = data.get('operation_id')
-    if not operation_id:
-        operation = Operation.query.filter_by(status=OperationStatus.ACTIVE).first()
-        if not operation:
-            return jsonify({'error': 'No active operation found'}), 400
-        operation_id = operation.id
+    try:
+        operation_id = operation_scope.resolve_operation_id(data.get('operation_id'))
+    except operation_scope.OperationScopeError as e:
+        return jsonify({'error': str(e)}), 400
     
     # Check if operation is closed
     operation = Operation.query.get(operation_id)
+    if not operation:
+        return jsonify({'error': 'Operation not found'}), 404
     if operation.status == OperationStatus.CLOSED:
         return jsonify({'error': 'Cannot add journal entry to closed operation'}), 400
     
@@ -55,6 +59,7 @@ def create_journal_entry():
     )
     
     db.session.add(entry)
+    operation_scope.touch(operation_id)
     db.session.commit()
     
     return jsonify(entry.to_dict()), 201
@@ -74,6 +79,7 @@ def update_journal_entry(entry_id):
     if 'entry_type' in data:
         entry.entry_type = data['entry_type']
     
+    operation_scope.touch(entry.operation_id)
     db.session.commit()
     return jsonify(entry.to_dict())
 
@@ -86,6 +92,7 @@ def delete_journal_entry(entry_id):
         return jsonify({'error': 'Cannot delete journal entry in closed operation'}), 400
     
     db.session.delete(entry)
+    operation_scope.touch(entry.operation_id)
     db.session.commit()
     
     return jsonify({'message': 'Journal entry deleted'}), 200
@@ -1,13 +1,12 @@
 from flask import Blueprint, request, jsonify
 from app import db
 from models import Location
-from geopy.geocoders import Nominatim
+import master_data
+import os
+import geocoding
 
 bp = Blueprint('locations', __name__, url_prefix='/api/locations')
 
-# Initialize geocoder
-geolocator = Nominatim(user_agent="tel-system")
-
 @bp.route('/', methods=['GET'])
 def get_locations():
     """Get all locations"""
@@ -26,7 +25,7 @@ def create_location():
     
     # Try to geocode the address
     try:
-        geo_result = geolocator.geocode(data.get('address'))
+        geo_result = geocoding.geocode(data.get('address'))
         if geo_result:
             location.latitude = geo_result.latitude
             location.longitude = geo_result.longitude
@@ -38,6 +37,20 @@ def create_location():
     
     return jsonify(location.to_dict()), 201
 
+@bp.route('/import', methods=['POST'])
+def import_locations():
+    """Create or update locations from a CSV or JSON file"""
+    try:
+        rows = master_data.rows_from_request(request)
+        report = master_data.import_locations(
+            rows, geocoding.get_geolocator(),
+            max_geocode=int(os.environ.get('GEOCODE_MAX_PER_REQUEST', 20))
+        )
+    except master_data.ImportValidationError as e:
+        return jsonify(e.to_dict()), 400
+    
+    return jsonify({'imported': len(report), 'rows': report}), 200
+
 @bp.route('/<int:location_id>', methods=['GET'])
 def get_location(location_id):
     """Get a single location"""
@@ -56,7 +69,7 @@ def update_location(location_id):
         location.address = data['address']
         # Re-geocode if address changed
         try:
-            geo_result = geolocator.geocode(data['address'])
+            geo_result = geocoding.geocode(data['address'])
             if geo_result:
                 location.latitude = geo_result.latitude
                 location.longitude = geo_result.longitude
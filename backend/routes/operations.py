@@ -3,13 +3,23 @@ from app import db
 from models import Operation, Assignment, JournalEntry, OperationStatus
 from datetime import datetime
 from sqlalchemy import desc
+import operation_stats
+import analytics
+import replay
+import operation_scope
 
 bp = Blueprint('operations', __name__, url_prefix='/api/operations')
 
 @bp.route('/', methods=['GET'])
 def get_operations():
-    """Get all operations"""
-    operations = Operation.query.order_by(desc(Operation.number)).all()
+    """Get all operations (?status=active|closed)"""
+    query = Operation.query
+    if request.args.get('status'):
+        try:
+            query = query.filter_by(status=OperationStatus(request.args['status']))
+        except ValueError:
+            return jsonify({'error': 'Invalid status'}), 400
+    operations = query.order_by(desc(Operation.number)).all()
     return jsonify([op.to_dict() for op in operations])
 
 @bp.route('/', methods=['POST'])
@@ -41,6 +51,8 @@ def create_operation():
     db.session.add(operation)
     db.session.commit()
     
+    operation_stats.get_stats(operation.id)
+    
     # Create initial journal entry
     journal_entry = JournalEntry(
         operation_id=operation.id,
@@ -48,6 +60,7 @@ def create_operation():
         content=f'Einsatzlage "{operation.title}" erstellt'
     )
     db.session.add(journal_entry)
+    operation_scope.touch(operation.id)
     db.session.commit()
     
     return jsonify(operation.to_dict()), 201
@@ -58,6 +71,53 @@ def get_operation(operation_id):
     operation = Operation.query.get_or_404(operation_id)
     return jsonify(operation.to_dict())
 
+@bp.route('/<int:operation_id>/stats', methods=['GET'])
+def get_operation_stats(operation_id):
+    """Get assignment, vehicle and personnel counters of an operation"""
+    Operation.query.get_or_404(operation_id)
+    
+    stats = operation_stats.get_stats(operation_id)
+    result = stats.to_dict()
+    result['open_assignment_age'] = operation_stats.open_assignment_ages(operation_id, stats.open_count)
+    
+    # Persist counters that were rebuilt on first access
+    db.session.commit()
+    return jsonify(result)
+
+@bp.route('/<int:operation_id>/state', methods=['GET'])
+def get_operation_state(operation_id):
+    """Get the state of an operation at a point in time (?at=ISO timestamp)"""
+    Operation.query.get_or_404(operation_id)
+    
+    try:
+        at = replay.parse_timestamp(request.args['at']) if request.args.get('at') else datetime.utcnow()
+    except ValueError:
+        return jsonify({'error': 'Invalid timestamp'}), 400
+    
+    state = replay.state_at(operation_id, at)
+    return jsonify({'at': at.isoformat(), 'state': state})
+
+@bp.route('/<int:operation_id>/frames', methods=['GET'])
+def get_operation_frames(operation_id):
+    """Get a sequence of states for playback (?from=&to=&step=seconds)"""
+    operation = Operation.query.get_or_404(operation_id)
+    
+    try:
+        start = replay.parse_timestamp(request.args['from']) if request.args.get('from') else operation.created_at
+        end = replay.parse_timestamp(request.args['to']) if request.args.get('to') else (operation.closed_at or datetime.utcnow())
+        step = replay.parse_step(request.args.get('step'))
+    except ValueError:
+        return jsonify({'error': 'Invalid from, to or step'}), 400
+    if replay.frame_count(start, end, step) > replay.MAX_FRAMES:
+        if not request.args.get('step'):
+            # Long operations: spread the frames over the whole range
+            step = (end - start) / (replay.MAX_FRAMES - 1)
+    if replay.frame_count(start, end, step) > replay.MAX_FRAMES:
+        return jsonify({'error': f'At most {replay.MAX_FRAMES} frames, use a larger step'}), 400
+    
+    frames = replay.frames(operation_id, start, end, step)
+    return jsonify({'step': step.total_seconds(), 'frames': frames})
+
 @bp.route('/<int:operation_id>', methods=['PUT'])
 def update_operation(operation_id):
     """Update an operation"""
@@ -72,6 +132,7 @@ def update_operation(operation_id):
     if 'description' in data:
         operation.description = data['description']
     
+    operation_scope.touch(operation.id)
     db.session.commit()
     return jsonify(operation.to_dict())
 
@@ -85,6 +146,8 @@ def close_operation(operation_id):
     
     operation.status = OperationStatus.CLOSED
     operation.closed_at = datetime.utcnow()
+    analytics.record_operation_closed(operation)
+    replay.record(operation.id, 'operation_closed', timestamp=operation.closed_at)
     
     # Create journal entry
     journal_entry = JournalEntry(
@@ -93,14 +156,37 @@ def close_operation(operation_id):
         content=f'Einsatzlage geschlossen'
     )
     db.session.add(journal_entry)
+    operation_scope.touch(operation.id)
     db.session.commit()
     
     return jsonify(operation.to_dict())
 
 @bp.route('/active', methods=['GET'])
 def get_active_operation():
-    """Get the currently active operation"""
-    operation = Operation.query.filter_by(status=OperationStatus.ACTIVE).first()
+    """Get an active operation (?operation_id= if still active, else the newest)"""
+    operation = None
+    if request.args.get('operation_id', '').isdigit():
+        operation = Operation.query.filter_by(
+            id=int(request.args['operation_id']), status=OperationStatus.ACTIVE
+        ).first()
+    if operation is None:
+        operation = Operation.query.filter_by(status=OperationStatus.ACTIVE).order_by(
+            desc(Operation.created_at)
+        ).first()
     if operation:
         return jsonify(operation.to_dict())
     return jsonify(None)
+
+@bp.route('/revisions', methods=['GET'])
+def get_operation_revisions():
+    """Get the revision counters of operations (?ids=1,2; default: all active)"""
+    if request.args.get('ids'):
+        try:
+            operation_ids = [int(i) for i in request.args['ids'].split(',') if i.strip()]
+        except ValueError:
+            return jsonify({'error': 'Invalid ids'}), 400
+    else:
+        operation_ids = [op.id for op in operation_scope.active_operations()]
+    
+    revisions = operation_scope.get_revisions(operation_ids)
+    return jsonify({str(operation_id): revision for operation_id, revision in revisions.items()})
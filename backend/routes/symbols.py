@@ -0,0 +1,42 @@
+from flask import Blueprint, request, jsonify, current_app
+from models import Vehicle
+import tactical_symbols
+
+bp = Blueprint('symbols', __name__, url_prefix='/api/symbols')
+
+def get_sprite():
+    return tactical_symbols.get_sprite(current_app)
+
+def svg_response(svg, etag):
+    """SVG response that clients revalidate cheaply via ETag"""
+    response = current_app.response_class(svg, mimetype='image/svg+xml')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response.make_conditional(request)
+
+@bp.route('/sprite.svg', methods=['GET'])
+def get_symbol_sprite():
+    """Get all tactical symbols as one SVG sprite"""
+    sprite = get_sprite()
+    return svg_response(sprite.sprite, sprite.etag)
+
+@bp.route('/manifest', methods=['GET'])
+def get_symbol_manifest():
+    """Get the vehicle type to symbol id mapping of the sprite"""
+    sprite = get_sprite()
+    response = jsonify(sprite.manifest)
+    response.set_etag(sprite.etag)
+    return response.make_conditional(request)
+
+@bp.route('/compose', methods=['GET'])
+def compose_symbol():
+    """Get a single symbol with a label, e.g. ?type=HLF&label=Florian 1-46-1"""
+    svg, etag = get_sprite().compose(request.args.get('type', ''), request.args.get('label', ''))
+    return svg_response(svg, etag)
+
+@bp.route('/vehicles/<int:vehicle_id>.svg', methods=['GET'])
+def get_vehicle_symbol(vehicle_id):
+    """Get the symbol of a vehicle labelled with its callsign"""
+    vehicle = Vehicle.query.get_or_404(vehicle_id)
+    svg, etag = get_sprite().compose(vehicle.vehicle_type or '', vehicle.callsign)
+    return svg_response(svg, etag)
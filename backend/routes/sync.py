@@ -0,0 +1,29 @@
+from flask import Blueprint, request, jsonify
+from app import db
+from models import Operation
+import operation_scope
+import sync
+
+bp = Blueprint('sync', __name__, url_prefix='/api/sync')
+
+@bp.route('', methods=['GET'])
+def get_changes():
+    """Get the rows of an operation changed since a revision (?operation_id=&since=)"""
+    try:
+        operation_id = operation_scope.resolve_operation_id(request.args.get('operation_id'))
+        since = int(request.args.get('since', 0))
+    except operation_scope.OperationScopeError as e:
+        return jsonify({'error': str(e)}), 400
+    except ValueError:
+        return jsonify({'error': 'Invalid since'}), 400
+    
+    if db.session.get(Operation, operation_id) is None:
+        return jsonify({'error': 'Operation not found'}), 404
+    
+    revision = operation_scope.get_revision(operation_id)
+    
+    # Unknown or future revisions (e.g. after a database reset) get a full snapshot
+    full = since <= 0 or since > revision
+    result = sync.snapshot(operation_id) if full else sync.delta(operation_id, since)
+    result.update({'operation_id': operation_id, 'revision': revision, 'full': full})
+    return jsonify(result)
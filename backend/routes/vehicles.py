@@ -1,6 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from app import db
-from models import Vehicle
+from models import Vehicle, VehicleStatusReport
+from datetime import datetime
+import analytics
+import operation_stats
+import master_data
+import replay
+import operation_scope
+import vehicle_status
 
 bp = Blueprint('vehicles', __name__, url_prefix='/api/vehicles')
 
@@ -28,6 +35,40 @@ def create_vehicle():
     
     return jsonify(vehicle.to_dict()), 201
 
+@bp.route('/import', methods=['POST'])
+def import_vehicles():
+    """Create or update vehicles from a CSV or JSON file"""
+    try:
+        rows = master_data.rows_from_request(request)
+        report = master_data.import_vehicles(rows)
+    except master_data.ImportValidationError as e:
+        return jsonify(e.to_dict()), 400
+    
+    return jsonify({'imported': len(report), 'rows': report}), 200
+
+@bp.route('/status', methods=['GET'])
+def get_vehicle_statuses():
+    """Get the latest FMS status of all vehicles"""
+    board = vehicle_status.get_board(current_app._get_current_object())
+    return jsonify([vehicle_status.status_dict(vehicle_id, entry)
+                    for vehicle_id, entry in sorted(board.latest().items())])
+
+@bp.route('/<int:vehicle_id>/status-history', methods=['GET'])
+def get_vehicle_status_history(vehicle_id):
+    """Get the FMS status history of a vehicle (?from=&to=&limit=), newest first"""
+    query = VehicleStatusReport.query.filter_by(vehicle_id=vehicle_id)
+    try:
+        if request.args.get('from'):
+            query = query.filter(VehicleStatusReport.timestamp >= replay.parse_timestamp(request.args['from']))
+        if request.args.get('to'):
+            query = query.filter(VehicleStatusReport.timestamp <= replay.parse_timestamp(request.args['to']))
+        limit = max(1, min(int(request.args.get('limit', 100)), 1000))
+    except ValueError:
+        return jsonify({'error': 'Invalid from, to or limit'}), 400
+    
+    reports = query.order_by(VehicleStatusReport.timestamp.desc(), VehicleStatusReport.id.desc()).limit(limit).all()
+    return jsonify([r.to_dict() for r in reports])
+
 @bp.route('/<int:vehicle_id>', methods=['GET'])
 def get_vehicle(vehicle_id):
     """Get a single vehicle"""
@@ -45,12 +86,18 @@ def update_vehicle(vehicle_id):
     if 'vehicle_type' in data:
         vehicle.vehicle_type = data['vehicle_type']
     if 'crew_count' in data:
+        old_crew_count = vehicle.crew_count
         vehicle.crew_count = data['crew_count']
+        operation_stats.vehicle_crew_changed(vehicle, old_crew_count)
     if 'location_id' in data:
         vehicle.location_id = data['location_id']
     if 'notes' in data:
         vehicle.notes = data['notes']
     
+    # Assignment lists show callsigns, stats count crews
+    if 'callsign' in data or 'crew_count' in data:
+        operation_scope.touch(*operation_scope.vehicle_operations(vehicle.id))
+    
     db.session.commit()
     return jsonify(vehicle.to_dict())
 
@@ -58,6 +105,13 @@ def update_vehicle(vehicle_id):
 def delete_vehicle(vehicle_id):
     """Delete a vehicle"""
     vehicle = Vehicle.query.get_or_404(vehicle_id)
+    operation_stats.vehicle_deleted(vehicle)
+    operation_scope.touch(*operation_scope.vehicle_operations(vehicle.id))
+    now = datetime.utcnow()
+    for va in vehicle.assignments:
+        analytics.record_vehicle_released(va.assignment, va, vehicle, now)
+        replay.record(va.assignment.operation_id, 'vehicle_unassigned', va.assignment_id, vehicle.id,
+                      timestamp=now, callsign=vehicle.callsign)
     db.session.delete(vehicle)
     db.session.commit()
     return jsonify({'message': 'Vehicle deleted'}), 200
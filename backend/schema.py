@@ -0,0 +1,97 @@
+"""Schema version check at startup.
+
+Instead of running ``create_all`` (which inspects every table) on each boot,
+startup reads a single ``schema_version`` row from the settings table. Only
+if it is missing or older than ``SCHEMA_VERSION`` are the tables created and
+the derived data backfilled. Bump ``SCHEMA_VERSION`` whenever models gain
+new tables, indexes or (nullable) columns.
+
+With ``SCHEMA_AUTO_UPGRADE=0`` an outdated database stops the startup
+instead, and ``flask init-db`` performs the upgrade explicitly (e.g. as a
+release step before the workers are recycled).
+"""
+from app import db
+from models import Settings
+import sqlalchemy as sa
+
+SCHEMA_VERSION = 8
+VERSION_KEY = 'schema_version'
+
+
+class SchemaError(RuntimeError):
+    """The database schema does not match this version of the code"""
+
+
+def current_version():
+    """Schema version recorded in the database (None for a fresh or unversioned one)"""
+    try:
+        setting = Settings.query.filter_by(key=VERSION_KEY).first()
+    except sa.exc.DBAPIError:
+        # Settings table does not exist yet
+        db.session.rollback()
+        return None
+    try:
+        return int(setting.value) if setting else None
+    except ValueError:
+        return None
+
+
+def _add_missing_columns():
+    """Add columns that were added to existing tables (create_all skips them)"""
+    inspector = sa.inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    quote = db.engine.dialect.identifier_preparer.quote
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            present = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                if not column.nullable:
+                    raise SchemaError(f'Cannot add NOT NULL column {table.name}.{column.name} automatically')
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                connection.execute(sa.text(
+                    f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}'
+                ))
+
+
+def upgrade():
+    """Create missing tables, columns and indexes, backfill derived data and record the version"""
+    import analytics
+    import operation_stats
+    import replay
+
+    db.create_all()
+    _add_missing_columns()
+    # create_all skips existing tables, including indexes added to them later
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    operation_stats.rebuild_missing_stats()
+    analytics.backfill_first_assigned()
+    replay.backfill_checkpoint_timestamps()
+    # Operations recorded before replay existed would otherwise replay partially
+    replay.rebuild_all()
+
+    setting = Settings.query.filter_by(key=VERSION_KEY).first()
+    if setting is None:
+        setting = Settings(key=VERSION_KEY)
+        db.session.add(setting)
+    setting.value = str(SCHEMA_VERSION)
+    db.session.commit()
+
+
+def verify(auto_upgrade=True):
+    """Check the schema version, upgrading an older database if allowed"""
+    version = current_version()
+    if version == SCHEMA_VERSION:
+        return version
+    if version is not None and version > SCHEMA_VERSION:
+        raise SchemaError(f'Database schema {version} is newer than this application ({SCHEMA_VERSION})')
+    if not auto_upgrade:
+        found = f'schema {version}' if version is not None else 'no schema version'
+        raise SchemaError(f'Database has {found}, {SCHEMA_VERSION} is required; run "flask init-db"')
+    upgrade()
+    return SCHEMA_VERSION
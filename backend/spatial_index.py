@@ -0,0 +1,171 @@
+"""Spatial index over stations for nearest-available-vehicle suggestions.
+
+Stations are bucketed into a regular latitude/longitude grid. A lookup walks
+rings of grid cells outwards from the incident and computes haversine
+distances for each ring's stations in one vectorized numpy call, stopping as
+soon as enough free vehicles have been found and no unvisited cell can be
+closer. numpy is imported on first use so it does not slow down startup.
+
+The index is rebuilt only when a cheap aggregate over the locations table
+changes, so it stays valid across worker processes without explicit
+invalidation.
+"""
+from app import db
+from models import Assignment, AssignmentStatus, Location, Vehicle, VehicleAssignment
+import heapq
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+CELL_SIZE_DEG = 0.1  # About 11 km north-south, 7 km east-west in Germany
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Distances in km from one point to arrays of points (all in degrees)"""
+    import numpy as np
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class StationIndex:
+    """Grid of station coordinates"""
+
+    def __init__(self, stations, cell_size=CELL_SIZE_DEG):
+        import numpy as np
+        self.cell_size = cell_size
+        self.cells = {}
+        for station_id, lat, lon in stations:
+            self.cells.setdefault(self._cell(lat, lon), []).append((station_id, lat, lon))
+        # Arrays per cell for vectorized distance computation
+        self.cells = {
+            cell: (np.array([s[0] for s in entries]),
+                   np.array([s[1] for s in entries], dtype=float),
+                   np.array([s[2] for s in entries], dtype=float))
+            for cell, entries in self.cells.items()
+        }
+        rows = [c[0] for c in self.cells]
+        cols = [c[1] for c in self.cells]
+        self.bounds = (min(rows), max(rows), min(cols), max(cols)) if self.cells else None
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+
+    def _ring(self, center, radius):
+        row, col = center
+        if radius == 0:
+            yield center
+            return
+        for c in range(col - radius, col + radius + 1):
+            yield (row - radius, c)
+            yield (row + radius, c)
+        for r in range(row - radius + 1, row + radius):
+            yield (r, col - radius)
+            yield (r, col + radius)
+
+    def nearest(self, lat, lon):
+        """Yield (station_id, distance_km) ordered by distance, ring by ring.
+
+        Stations of a ring are only released once no closer station can exist
+        in a ring that has not been searched yet.
+        """
+        if not self.bounds:
+            return
+        center = self._cell(lat, lon)
+        min_row, max_row, min_col, max_col = self.bounds
+        max_ring = max(center[0] - min_row, max_row - center[0], center[1] - min_col, max_col - center[1], 0)
+        pending = []
+        for radius in range(max_ring + 1):
+            for cell in self._ring(center, radius):
+                if cell in self.cells:
+                    ids, lats, lons = self.cells[cell]
+                    distances = haversine_km(lat, lon, lats, lons)
+                    for station_id, distance in zip(ids.tolist(), distances.tolist()):
+                        heapq.heappush(pending, (distance, station_id))
+            # Any unsearched cell is at least ``radius`` cells away; longitude
+            # cells shrink towards the pole, so use the outermost latitude
+            outer_lat = min(abs(lat) + (radius + 1) * self.cell_size, 89.0)
+            safe = radius * self.cell_size * 111.19 * math.cos(math.radians(outer_lat))
+            while pending and pending[0][0] <= safe:
+                distance, station_id = heapq.heappop(pending)
+                yield station_id, distance
+        while pending:
+            distance, station_id = heapq.heappop(pending)
+            yield station_id, distance
+
+
+_index = None
+_signature = None
+
+
+def get_station_index():
+    """Return the station index, rebuilding it if the locations changed"""
+    global _index, _signature
+    signature = tuple(db.session.query(
+        db.func.count(Location.id),
+        db.func.max(Location.id),
+        db.func.sum(Location.id * Location.latitude),
+        db.func.sum(Location.id * Location.longitude)
+    ).filter(Location.latitude.isnot(None), Location.longitude.isnot(None)).one())
+    if _index is None or signature != _signature:
+        stations = db.session.query(Location.id, Location.latitude, Location.longitude).filter(
+            Location.latitude.isnot(None), Location.longitude.isnot(None)
+        ).all()
+        _index = StationIndex(stations)
+        _signature = signature
+    return _index
+
+
+def _free_vehicles_by_station(vehicle_types=None):
+    """Vehicles that are not on any non-completed assignment, grouped by station"""
+    busy = db.session.query(VehicleAssignment.vehicle_id).join(Assignment).filter(
+        Assignment.status != AssignmentStatus.COMPLETED
+    )
+    query = Vehicle.query.filter(Vehicle.location_id.isnot(None), Vehicle.id.notin_(busy))
+    if vehicle_types:
+        query = query.filter(Vehicle.vehicle_type.in_(vehicle_types))
+    by_station = {}
+    for vehicle in query.order_by(Vehicle.callsign).all():
+        by_station.setdefault(vehicle.location_id, []).append(vehicle)
+    return by_station
+
+
+def suggest_vehicles(assignments, vehicle_types=None, limit=10, exclusive=False):
+    """Rank free vehicles by distance of their station for each assignment.
+
+    Returns a dict assignment id -> list of suggestions. The index and the
+    set of free vehicles are loaded once for the whole batch. Suggestions are
+    independent, so the same nearest vehicle can appear for every assignment;
+    with ``exclusive`` a vehicle is only suggested for the first assignment
+    (in the given order) that lists it.
+    """
+    index = get_station_index()
+    by_station = _free_vehicles_by_station(vehicle_types)
+    names = dict(db.session.query(Location.id, Location.name).filter(
+        Location.id.in_(list(by_station))
+    ).all()) if by_station else {}
+
+    taken = set()
+    result = {}
+    for assignment in assignments:
+        suggestions = []
+        if assignment.latitude is not None and assignment.longitude is not None and by_station:
+            for station_id, distance in index.nearest(assignment.latitude, assignment.longitude):
+                for vehicle in by_station.get(station_id, []):
+                    if vehicle.id in taken:
+                        continue
+                    suggestions.append({
+                        'vehicle_id': vehicle.id,
+                        'callsign': vehicle.callsign,
+                        'vehicle_type': vehicle.vehicle_type,
+                        'crew_count': vehicle.crew_count,
+                        'location_id': station_id,
+                        'location_name': names.get(station_id),
+                        'distance_km': round(distance, 2)
+                    })
+                if len(suggestions) >= limit:
+                    break
+        result[assignment.id] = suggestions[:limit]
+        if exclusive:
+            taken.update(s['vehicle_id'] for s in result[assignment.id])
+    return result
@@ -0,0 +1,109 @@
+"""Import-time and startup profiling.
+
+``python app.py --profile-startup`` starts a fresh interpreter with
+``-X importtime``, imports the app, runs ``create_app()`` and serves one
+request through the test client. It reports the time of each phase, the
+startup phases recorded inside ``create_app()`` and the packages that take
+longest to import.
+
+It exits with status 1 if the app needs longer than ``STARTUP_BUDGET``
+until the first response, so CI catches cold-start regressions. The default
+leaves about twice the measured baseline (0.6-0.9 s) as headroom for slower
+machines; ``--budget SECONDS`` or ``STARTUP_BUDGET_SECONDS`` override it and
+``--budget 0`` only reports.
+"""
+from contextlib import contextmanager
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+STARTUP_BUDGET = 2.0  # seconds until the first response
+
+CHILD = '''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+application.test_client().get('/api/external/health')
+served = time.perf_counter()
+print(json.dumps({
+    'phases': {'import': imported - start, 'create_app': created - imported, 'first_request': served - created},
+    'create_app': application.extensions['startup_timings']
+}))
+'''
+
+
+@contextmanager
+def timed(timings, phase):
+    """Record the duration of a startup phase in seconds"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = time.perf_counter() - start
+
+
+def parse_importtime(output):
+    """Self import time in seconds per top-level package from ``-X importtime`` output"""
+    packages = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        package = fields[2].strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(fields[0]) / 1e6
+    return packages
+
+
+def profile(env=None):
+    """Profile a cold start in a new interpreter"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f'Startup failed:\n{result.stderr[-4000:]}')
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['wall'] = wall
+    report['imports'] = parse_importtime(result.stderr)
+    return report
+
+
+def print_report(report, top=15):
+    phases = report['phases']
+    ready = sum(phases.values())
+    print(f"Cold start: {ready * 1000:.0f} ms until first response "
+          f"({report['wall'] * 1000:.0f} ms including interpreter)")
+    for phase, seconds in phases.items():
+        print(f"  {phase:<16} {seconds * 1000:8.1f} ms")
+    print('create_app():')
+    for phase, seconds in report['create_app'].items():
+        print(f"  {phase:<16} {seconds * 1000:8.1f} ms")
+    print(f'Slowest imports (self time per package, top {top}):')
+    for package, seconds in sorted(report['imports'].items(), key=lambda item: -item[1])[:top]:
+        print(f"  {package:<24} {seconds * 1000:8.1f} ms")
+    return ready
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='app.py --profile-startup')
+    parser.add_argument('--profile-startup', action='store_true')
+    parser.add_argument('--budget', type=float,
+                        default=float(os.environ.get('STARTUP_BUDGET_SECONDS', STARTUP_BUDGET)),
+                        help='Fail if the first response takes longer (seconds, 0 to disable)')
+    parser.add_argument('--top', type=int, default=15, help='Number of packages to list')
+    args = parser.parse_args(argv)
+
+    ready = print_report(profile(), top=args.top)
+    if args.budget and ready > args.budget:
+        print(f"Startup budget exceeded: {ready:.2f} s > {args.budget:.2f} s")
+        return 1
+    return 0
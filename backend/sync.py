@@ -0,0 +1,193 @@
+"""Delta sync for offline-capable clients.
+
+Session hooks note every flushed change of assignments (including their
+vehicle links), journal entries, vehicles and operations. On commit the
+affected operations get a new revision and ``SyncChange`` keeps one row per
+changed row and operation, carrying that revision and a ``deleted`` flag as
+tombstone. Vehicles are master data shown in every operation, so their
+changes are recorded for all active operations.
+
+``GET /api/sync?operation_id=<id>&since=<revision>`` then returns only the
+rows changed after ``since``. The revision row of an operation is locked by
+the UPDATE that increments it until the transaction ends, so revisions of
+one operation become visible in order and a client never skips a change.
+"""
+from app import db
+from models import Assignment, JournalEntry, Operation, OperationStatus, SyncChange, Vehicle, VehicleAssignment
+from db_routing import RoutingSession
+from itertools import chain
+import sqlalchemy as sa
+import operation_scope
+
+CHANGES_KEY = 'sync_changes'
+
+
+def _change(obj):
+    """(entity, entity_id, operation_id) a changed object stands for, or None"""
+    if isinstance(obj, Assignment):
+        return 'assignment', obj.id, obj.operation_id
+    if isinstance(obj, JournalEntry):
+        return 'journal', obj.id, obj.operation_id
+    if isinstance(obj, VehicleAssignment):
+        # Vehicle links are part of the assignment (its vehicle list)
+        return 'assignment', obj.assignment_id, None
+    if isinstance(obj, Vehicle):
+        return 'vehicle', obj.id, None
+    if isinstance(obj, Operation):
+        return 'operation', obj.id, obj.id
+    return None
+
+
+def _record_flush(session, flush_context):
+    changes = session.info.setdefault(CHANGES_KEY, {})
+    flushed = chain(
+        ((obj, False) for obj in session.new),
+        ((obj, False) for obj in session.dirty if session.is_modified(obj)),
+        ((obj, True) for obj in session.deleted)
+    )
+    for obj, deleted in flushed:
+        change = _change(obj)
+        if change is None:
+            continue
+        entity, entity_id, operation_id = change
+        # A link removed together with its assignment must not undo the tombstone
+        if isinstance(obj, VehicleAssignment):
+            deleted = False
+        entry = changes.setdefault((entity, entity_id), {'operation_id': None, 'deleted': False})
+        entry['operation_id'] = entry['operation_id'] or operation_id
+        entry['deleted'] = entry['deleted'] or deleted
+
+
+def _operations_of(changes):
+    """Rows to record per operation id"""
+    vehicle_ids = [entity_id for entity, entity_id in changes if entity == 'vehicle']
+    if vehicle_ids:
+        # Assignments list the callsigns of their vehicles
+        linked = db.session.query(VehicleAssignment.assignment_id).filter(
+            VehicleAssignment.vehicle_id.in_(vehicle_ids)
+        ).distinct().all()
+        for (assignment_id,) in linked:
+            changes.setdefault(('assignment', assignment_id), {'operation_id': None, 'deleted': False})
+
+    unresolved = [entity_id for (entity, entity_id), entry in changes.items()
+                  if entity == 'assignment' and entry['operation_id'] is None]
+    assignment_operations = dict(db.session.query(Assignment.id, Assignment.operation_id).filter(
+        Assignment.id.in_(unresolved)
+    ).all()) if unresolved else {}
+    active = [row[0] for row in db.session.query(Operation.id).filter_by(status=OperationStatus.ACTIVE)] \
+        if vehicle_ids else []
+
+    by_operation = {}
+    for (entity, entity_id), entry in changes.items():
+        if entity == 'vehicle':
+            targets = active
+        else:
+            targets = [entry['operation_id'] or assignment_operations.get(entity_id)]
+        for operation_id in targets:
+            if operation_id is not None:
+                by_operation.setdefault(operation_id, []).append((entity, entity_id, entry['deleted']))
+    return by_operation
+
+
+def _write_changes(session):
+    # before_commit runs ahead of the final flush
+    session.flush()
+    changes = session.info.pop(CHANGES_KEY, None)
+    if not changes:
+        return
+    with session.no_autoflush:
+        by_operation = _operations_of(changes)
+    if not by_operation:
+        return
+
+    touched = session.info.get(operation_scope.TOUCHED_KEY, set())
+    operation_scope.touch(*(operation_id for operation_id in by_operation if operation_id not in touched))
+    revisions = operation_scope.get_revisions(list(by_operation))
+
+    for operation_id, rows in sorted(by_operation.items()):
+        by_entity = {}
+        for entity, entity_id, _ in rows:
+            by_entity.setdefault(entity, []).append(entity_id)
+        for entity, entity_ids in by_entity.items():
+            session.execute(sa.delete(SyncChange).where(
+                SyncChange.operation_id == operation_id,
+                SyncChange.entity == entity,
+                SyncChange.entity_id.in_(entity_ids)
+            ))
+        session.execute(sa.insert(SyncChange), [{
+            'operation_id': operation_id,
+            'revision': revisions[operation_id],
+            'entity': entity,
+            'entity_id': entity_id,
+            'deleted': deleted
+        } for entity, entity_id, deleted in rows])
+
+
+def _reset(session, *args):
+    session.info.pop(CHANGES_KEY, None)
+    session.info.pop(operation_scope.TOUCHED_KEY, None)
+
+
+def init_app(app):
+    """Record changes of every session (once per process)"""
+    if not sa.event.contains(RoutingSession, 'after_flush', _record_flush):
+        sa.event.listen(RoutingSession, 'after_flush', _record_flush)
+        sa.event.listen(RoutingSession, 'before_commit', _write_changes)
+        sa.event.listen(RoutingSession, 'after_commit', _reset)
+        sa.event.listen(RoutingSession, 'after_rollback', _reset)
+
+
+def snapshot(operation_id):
+    """All rows a client of the operation needs"""
+    operation = db.session.get(Operation, operation_id)
+    assignments = Assignment.query.filter_by(operation_id=operation_id).options(
+        db.selectinload(Assignment.vehicle_assignments).joinedload(VehicleAssignment.vehicle)
+    ).order_by(Assignment.created_at).all()
+    journal = JournalEntry.query.filter_by(operation_id=operation_id).order_by(JournalEntry.timestamp).all()
+    return {
+        'operation': operation.to_dict() if operation else None,
+        'assignments': [a.to_dict() for a in assignments],
+        'journal': [e.to_dict() for e in journal],
+        'vehicles': [v.to_dict() for v in Vehicle.query.order_by(Vehicle.callsign).all()],
+        'deleted': {'assignments': [], 'journal': [], 'vehicles': []}
+    }
+
+
+def delta(operation_id, since):
+    """Rows changed after revision ``since`` plus tombstones of deleted rows"""
+    changes = SyncChange.query.filter(
+        SyncChange.operation_id == operation_id,
+        SyncChange.revision > since
+    ).all()
+    ids = {'assignment': set(), 'journal': set(), 'vehicle': set()}
+    deleted = {'assignment': set(), 'journal': set(), 'vehicle': set()}
+    operation_changed = False
+    for change in changes:
+        if change.entity == 'operation':
+            operation_changed = True
+        elif change.entity in ids:
+            (deleted if change.deleted else ids)[change.entity].add(change.entity_id)
+
+    assignments = Assignment.query.filter(Assignment.id.in_(ids['assignment'])).options(
+        db.selectinload(Assignment.vehicle_assignments).joinedload(VehicleAssignment.vehicle)
+    ).all() if ids['assignment'] else []
+    journal = JournalEntry.query.filter(JournalEntry.id.in_(ids['journal'])).all() if ids['journal'] else []
+    vehicles = Vehicle.query.filter(Vehicle.id.in_(ids['vehicle'])).all() if ids['vehicle'] else []
+
+    # Rows deleted after their change was recorded become tombstones as well
+    deleted['assignment'] |= ids['assignment'] - {a.id for a in assignments}
+    deleted['journal'] |= ids['journal'] - {e.id for e in journal}
+    deleted['vehicle'] |= ids['vehicle'] - {v.id for v in vehicles}
+
+    operation = db.session.get(Operation, operation_id) if operation_changed else None
+    return {
+        'operation': operation.to_dict() if operation else None,
+        'assignments': [a.to_dict() for a in sorted(assignments, key=lambda a: a.created_at)],
+        'journal': [e.to_dict() for e in sorted(journal, key=lambda e: e.timestamp)],
+        'vehicles': [v.to_dict() for v in vehicles],
+        'deleted': {
+            'assignments': sorted(deleted['assignment']),
+            'journal': sorted(deleted['journal']),
+            'vehicles': sorted(deleted['vehicle'])
+        }
+    }
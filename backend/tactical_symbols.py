@@ -0,0 +1,244 @@
+"""Tactical symbol sprite sheet and server-side symbol composition.
+
+On first use the SVG files in the tactical symbol directory are merged into a
+single sprite with one ``<symbol>`` per file. The embedded font stylesheet
+that every file carries is emitted only once and its rules are scoped to the
+``ts-symbol`` class, so they do not restyle other SVG text of the page the
+sprite is inlined into. Element ids are prefixed per symbol so clip paths do
+not collide, and editor metadata is dropped. The map then needs one request
+for all symbols and references them with ``<use>``.
+
+``TACTICAL_SYMBOLS`` is the only vehicle type mapping; the frontend reads it
+from ``/api/symbols/manifest``.
+"""
+from xml.sax.saxutils import escape
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+import xml.etree.ElementTree as ET
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+XLINK_NS = 'http://www.w3.org/1999/xlink'
+
+SYMBOL_CLASS = 'ts-symbol'
+COMPOSE_CACHE_SIZE = 1024
+
+# Vehicle type -> symbol file
+TACTICAL_SYMBOLS = {
+    # Einsatzleitung
+    'ELW': 'ELW_1.svg',
+
+    # Löschfahrzeuge
+    'HLF': 'Hilfeleistungslöschfahrzeug.svg',
+    'LF': 'Löschfahrzeug.svg',
+    'StLF': 'Löschfahrzeug_10.svg',
+    'TLF': 'Tanklöschfahrzeug.svg',
+    'TSF': 'Tragkraftspritzenfahrzeug.svg',
+    'TSF-W': 'Tragkraftspritzenfahrzeug.svg',
+
+    # Rüst- und Gerätewagen
+    'GW-L1': 'Gerätewagen_Logistik_1.svg',
+    'GW-L2': 'Gerätewagen_Logistik_2.svg',
+    'RW': 'Rüstwagen.svg',
+
+    # Mannschaft und Transport
+    'MTF': 'Mannschaftstransportwagen.svg',
+    'MTW': 'Mannschaftstransportwagen.svg',
+
+    # Hubrettungsfahrzeuge
+    'DLK': 'Drehleiter_Automatik_mit Korb.svg',
+
+    # Rettungsfahrzeuge
+    'KTW': 'Krankentransportwagen.svg',
+    'NEF': 'Notarzteinsatzfahrzeug.svg',
+    'RTW': 'Rettungswagen.svg',
+
+    # Station/Gerätehaus
+    'STATION': 'Feuerwehrgerätehaus.svg'
+}
+
+
+def symbol_id(filename):
+    """ASCII-only element id for a symbol file, e.g. 'ts-Loeschfahrzeug_10'"""
+    name = os.path.splitext(filename)[0]
+    for umlaut, replacement in (('ä', 'ae'), ('ö', 'oe'), ('ü', 'ue'), ('Ä', 'Ae'), ('Ö', 'Oe'), ('Ü', 'Ue'), ('ß', 'ss')):
+        name = name.replace(umlaut, replacement)
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return 'ts-' + re.sub(r'[^A-Za-z0-9_-]+', '_', name)
+
+
+def _scope_css(css, scope):
+    """Prefix the selectors of all top-level style rules (not @-rules) with ``scope``"""
+    rules = []
+    depth = 0
+    start = 0
+    for position, char in enumerate(css):
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                rules.append(css[start:position + 1].strip())
+                start = position + 1
+    scoped = []
+    for rule in rules:
+        selectors, body = rule.split('{', 1)
+        if not selectors.strip().startswith('@'):
+            selectors = ', '.join(f'{scope} {selector.strip()}' for selector in selectors.split(','))
+        scoped.append(f'{selectors.strip()} {{{body}')
+    return ' '.join(scoped)
+
+
+def _is_svg(tag):
+    return tag.startswith('{%s}' % SVG_NS)
+
+
+def _strip_foreign(element):
+    """Remove editor elements and foreign attributes, drop the SVG namespace from tags"""
+    for child in list(element):
+        if not isinstance(child.tag, str) or not _is_svg(child.tag) or child.tag == '{%s}metadata' % SVG_NS:
+            element.remove(child)
+        else:
+            _strip_foreign(child)
+    element.tag = element.tag.split('}', 1)[-1]
+    for name in list(element.attrib):
+        if name.startswith('{%s}' % XLINK_NS):
+            element.set('xlink:' + name.split('}', 1)[1], element.attrib.pop(name))
+        elif name.startswith('{'):
+            del element.attrib[name]
+
+
+def _prefix_ids(root, prefix):
+    """Make all ids unique within the sprite and rewrite references to them"""
+    ids = {el.get('id') for el in root.iter() if el.get('id')}
+    if not ids:
+        return
+    pattern = re.compile(r'url\(#(%s)\)' % '|'.join(re.escape(i) for i in ids))
+    for el in root.iter():
+        if el.get('id'):
+            el.set('id', f'{prefix}-{el.get("id")}')
+        for name, value in el.attrib.items():
+            if 'url(#' in value:
+                el.set(name, pattern.sub(lambda m: f'url(#{prefix}-{m.group(1)})', value))
+            elif name in ('href', 'xlink:href') and value.startswith('#') and value[1:] in ids:
+                el.set(name, f'#{prefix}-{value[1:]}')
+
+
+class SymbolSprite:
+    """Sprite sheet and manifest built from a directory of symbol SVGs"""
+
+    def __init__(self, directory, mapping=TACTICAL_SYMBOLS):
+        self.directory = directory
+        self.mapping = mapping
+        self.styles = []
+        self.symbols = {}  # symbol id -> (viewBox, inner markup)
+        self.files = {}  # symbol id -> file name
+        self._composed = {}  # (vehicle type, label) -> (svg, etag)
+        self._build()
+
+        self.sprite = self._render_sprite()
+        self.etag = hashlib.sha256(self.sprite.encode('utf-8')).hexdigest()[:32]
+        self.manifest = {
+            'etag': self.etag,
+            'types': {vehicle_type: symbol_id(filename) for vehicle_type, filename in mapping.items()
+                      if symbol_id(filename) in self.symbols},
+            'symbols': {sid: {'viewBox': view_box, 'file': self.files[sid]}
+                        for sid, (view_box, _) in self.symbols.items()}
+        }
+
+    def _build(self):
+        seen_styles = set()
+        files = sorted(f for f in os.listdir(self.directory) if f.lower().endswith('.svg')) \
+            if os.path.isdir(self.directory) else []
+        for filename in files:
+            sid = symbol_id(filename)
+            root = ET.parse(os.path.join(self.directory, filename)).getroot()
+            _strip_foreign(root)
+
+            # Embedded stylesheets (font-face) are shared by all symbols
+            for style in root.iter('style'):
+                css = _scope_css(' '.join((style.text or '').split()), f'.{SYMBOL_CLASS}')
+                if css and css not in seen_styles:
+                    seen_styles.add(css)
+                    self.styles.append(css)
+            for parent in root.iter():
+                for child in list(parent):
+                    if child.tag == 'style':
+                        parent.remove(child)
+
+            _prefix_ids(root, sid)
+            view_box = root.get('viewBox') or '0 0 %s %s' % (
+                root.get('width', '256').rstrip('px'), root.get('height', '256').rstrip('px'))
+            inner = ''.join(ET.tostring(child, encoding='unicode') for child in root)
+            self.symbols[sid] = (view_box, inner)
+            self.files[sid] = filename
+
+    def _style_markup(self):
+        return ''.join(f'<style type="text/css"><![CDATA[{css}]]></style>' for css in self.styles)
+
+    def _render_sprite(self):
+        symbols = ''.join(f'<symbol id="{sid}" class="{SYMBOL_CLASS}" viewBox="{view_box}">{inner}</symbol>'
+                          for sid, (view_box, inner) in self.symbols.items())
+        return (f'<svg xmlns="{SVG_NS}" xmlns:xlink="{XLINK_NS}" style="display:none">'
+                f'<defs>{self._style_markup()}</defs>{symbols}</svg>')
+
+    def symbol_for_type(self, vehicle_type):
+        sid = self.manifest['types'].get(vehicle_type)
+        return sid if sid in self.symbols else None
+
+    def compose(self, vehicle_type, label):
+        """Standalone SVG of a vehicle symbol with its callsign below (memoized per sprite)"""
+        key = (vehicle_type, label)
+        cached = self._composed.get(key)
+        if cached is None:
+            if len(self._composed) >= COMPOSE_CACHE_SIZE:
+                self._composed.clear()
+            cached = self._composed[key] = self._compose(vehicle_type, label)
+        return cached
+
+    def _compose(self, vehicle_type, label):
+        sid = self.symbol_for_type(vehicle_type)
+        label_markup = ''
+        if label:
+            label_markup = (f'<text x="128" y="290" text-anchor="middle" font-family="Arial, sans-serif" '
+                            f'font-weight="bold" font-size="36" fill="#000000" stroke="#FFFFFF" '
+                            f'stroke-width="6" paint-order="stroke">{escape(label)}</text>')
+        if sid:
+            view_box, inner = self.symbols[sid]
+            body = (f'<svg class="{SYMBOL_CLASS}" x="0" y="0" width="256" height="256" '
+                    f'viewBox="{view_box}">{inner}</svg>')
+            styles = self._style_markup()
+        else:
+            # Unknown type: plain box with the type abbreviation
+            body = (f'<rect x="10" y="64" width="236" height="128" fill="#FFFFFF" stroke="#000000" stroke-width="4"/>'
+                    f'<text x="128" y="128" text-anchor="middle" dominant-baseline="central" '
+                    f'font-family="Arial, sans-serif" font-weight="bold" font-size="48">{escape(vehicle_type or "?")}</text>')
+            styles = ''
+        svg = (f'<svg xmlns="{SVG_NS}" xmlns:xlink="{XLINK_NS}" width="256" height="310" viewBox="0 0 256 310">'
+               f'<defs>{styles}</defs>{body}{label_markup}</svg>')
+        etag = hashlib.sha256(svg.encode('utf-8')).hexdigest()[:32]
+        return svg, etag
+
+
+_build_lock = threading.Lock()
+
+
+def init_app(app):
+    """Remember the symbol directory; the sprite is built on first request"""
+    app.config['TACTICAL_SYMBOLS_DIR'] = os.environ.get('TACTICAL_SYMBOLS_DIR') or os.path.join(
+        app.static_folder, 'assets', 'tactical-symbols')
+    app.extensions['tactical_symbols'] = None
+
+
+def get_sprite(app):
+    """Return the app's sprite, building it once"""
+    sprite = app.extensions.get('tactical_symbols')
+    if sprite is None:
+        with _build_lock:
+            sprite = app.extensions.get('tactical_symbols')
+            if sprite is None:
+                sprite = SymbolSprite(app.config['TACTICAL_SYMBOLS_DIR'])
+                app.extensions['tactical_symbols'] = sprite
+    return sprite
@@ -0,0 +1,33 @@
+"""Cold-start regression check.
+
+Runs ``startup_profile.profile()`` against a throwaway SQLite database and
+fails if the first response takes longer than ``STARTUP_BUDGET`` (or
+``STARTUP_BUDGET_SECONDS``). Run from ``backend/``::
+
+    python -m unittest discover -s tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import startup_profile  # noqa: E402
+
+
+class StartupBudgetTest(unittest.TestCase):
+
+    def test_cold_start_within_budget(self):
+        budget = float(os.environ.get('STARTUP_BUDGET_SECONDS', startup_profile.STARTUP_BUDGET))
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(directory, 'startup.db')}")
+            # The first start creates the schema; the budget applies to a migrated database
+            startup_profile.profile(env)
+            report = startup_profile.profile(env)
+        ready = sum(report['phases'].values())
+        self.assertLessEqual(ready, budget, f'Cold start took {ready:.2f} s, budget is {budget:.2f} s')
+
+
+if __name__ == '__main__':
+    unittest.main()
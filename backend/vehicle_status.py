@@ -0,0 +1,342 @@
+"""Live FMS vehicle status with coalesced persistence.
+
+Status telegrams arrive through the external API, often in bursts. The
+latest status of every vehicle is kept in an in-memory table that the
+dashboard and map read directly. Telegrams are written to
+``vehicle_status_history`` by a background thread every
+``FMS_FLUSH_INTERVAL`` seconds (default 2) or as soon as ``FMS_FLUSH_BATCH``
+(default 500) are pending, as one batched insert and one commit.
+
+In the same transaction, status changes of vehicles that are on a
+non-completed assignment of an active operation are mirrored into that
+operation's journal.
+
+The buffer holds at most ``FMS_MAX_PENDING`` telegrams (default 50000);
+beyond that the API answers 429 so the sender retries later. A batch that
+fails to be written is retried ``FMS_MAX_ATTEMPTS`` times (default 5) and
+then dropped, so a broken database cannot grow the buffer without bound.
+
+The table lives in the process. On first use it is loaded from the history,
+so it survives restarts; with several worker processes each one only knows
+the telegrams it received itself since then.
+"""
+from app import db
+from models import (Assignment, AssignmentStatus, JournalEntry, Operation, OperationStatus, Vehicle,
+                    VehicleAssignment, VehicleStatusReport)
+from datetime import datetime, timedelta
+import atexit
+import os
+import threading
+import operation_scope
+import rate_limit
+import replay
+
+FMS_STATUS = {
+    0: 'Priorisierter Sprechwunsch',
+    1: 'Einsatzbereit über Funk',
+    2: 'Einsatzbereit auf Wache',
+    3: 'Einsatz übernommen',
+    4: 'Am Einsatzort',
+    5: 'Sprechwunsch',
+    6: 'Nicht einsatzbereit',
+    7: 'Patient aufgenommen',
+    8: 'Am Transportziel',
+    9: 'Fremdanmeldung',
+}
+
+MAX_BATCH = 1000
+# Telegrams further ahead than this are rejected; they would pin the live status
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+
+def parse_telegrams(data):
+    """Telegram list from a single object, a list or ``{"telegrams": [...]}``"""
+    if isinstance(data, dict):
+        data = data.get('telegrams', [data])
+    if not isinstance(data, list):
+        raise ValueError('Expected a telegram object or a list of telegrams')
+    if len(data) > MAX_BATCH:
+        raise ValueError(f'At most {MAX_BATCH} telegrams per request')
+    return data
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _resolve_vehicles(telegrams):
+    """Map of vehicle id and callsign -> (id, callsign) for a batch, in one query"""
+    ids = {t['vehicle_id'] for t in telegrams if isinstance(t, dict) and _is_int(t.get('vehicle_id'))}
+    callsigns = {t['callsign'] for t in telegrams if isinstance(t, dict) and isinstance(t.get('callsign'), str)}
+    if not ids and not callsigns:
+        return {}
+    rows = db.session.query(Vehicle.id, Vehicle.callsign).filter(
+        db.or_(Vehicle.id.in_(ids), Vehicle.callsign.in_(callsigns))
+    ).all()
+    vehicles = {}
+    for vehicle_id, callsign in rows:
+        vehicles[('id', vehicle_id)] = (vehicle_id, callsign)
+        vehicles[('callsign', callsign)] = (vehicle_id, callsign)
+    return vehicles
+
+
+def _validate(telegram, vehicles, now):
+    """Normalized telegram or an error message"""
+    if not isinstance(telegram, dict):
+        return None, 'Telegram must be an object'
+    if telegram.get('vehicle_id') is not None:
+        if not _is_int(telegram['vehicle_id']):
+            return None, 'vehicle_id must be an integer'
+        vehicle = vehicles.get(('id', telegram['vehicle_id']))
+    elif telegram.get('callsign'):
+        if not isinstance(telegram['callsign'], str):
+            return None, 'callsign must be a string'
+        vehicle = vehicles.get(('callsign', telegram['callsign']))
+    else:
+        return None, 'vehicle_id or callsign is required'
+    if vehicle is None:
+        return None, 'Unknown vehicle'
+
+    # FMS digits may arrive as numbers or as strings ("3")
+    status = telegram.get('status')
+    if isinstance(status, str) and status.strip().isdigit():
+        status = int(status)
+    if not _is_int(status) or status not in FMS_STATUS:
+        return None, 'status must be an FMS status 0-9'
+
+    try:
+        timestamp = replay.parse_timestamp(telegram['timestamp']) if telegram.get('timestamp') else now
+    except (TypeError, ValueError):
+        return None, 'Invalid timestamp'
+    if timestamp > now + MAX_CLOCK_SKEW:
+        return None, 'timestamp is in the future'
+    return {'vehicle_id': vehicle[0], 'callsign': vehicle[1], 'status': status, 'timestamp': timestamp}, None
+
+
+class StatusBoard:
+    """Latest status per vehicle plus the buffer of telegrams not yet written"""
+
+    def __init__(self, app, flush_interval=2.0, flush_batch=500, max_pending=50000, max_attempts=5):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._latest = None
+        self._pending = []
+        self._flushing = 0
+        self._failures = 0
+        self._thread = None
+        self.received = 0
+        self.rejected = 0
+        self.written = 0
+        self.flushes = 0
+        self.journal_entries = 0
+        self.dropped = 0
+
+    def _load(self):
+        """Latest status per vehicle from the history"""
+        ranked = db.session.query(
+            VehicleStatusReport.vehicle_id,
+            VehicleStatusReport.status,
+            VehicleStatusReport.timestamp,
+            db.func.row_number().over(
+                partition_by=VehicleStatusReport.vehicle_id,
+                order_by=(VehicleStatusReport.timestamp.desc(), VehicleStatusReport.id.desc())
+            ).label('rank')
+        ).subquery()
+        rows = db.session.query(ranked.c.vehicle_id, ranked.c.status, ranked.c.timestamp).filter(ranked.c.rank == 1)
+        return {vehicle_id: {'status': status, 'timestamp': timestamp} for vehicle_id, status, timestamp in rows}
+
+    def _ensure_loaded(self):
+        if self._latest is None:
+            latest = self._load()
+            with self._lock:
+                if self._latest is None:
+                    self._latest = latest
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='fms-status-flush', daemon=True)
+                    self._thread.start()
+                    atexit.register(self._flush_in_context)
+
+    def ingest(self, telegrams, source=None):
+        """Update the live table and queue telegrams for the history.
+
+        Returns the number of accepted telegrams and a list of errors by index.
+        """
+        self._ensure_loaded()
+        now = datetime.utcnow()
+        vehicles = _resolve_vehicles(telegrams)
+
+        accepted = 0
+        errors = []
+        with self._lock:
+            if len(self._pending) + self._flushing + len(telegrams) > self.max_pending:
+                raise rate_limit.RateLimited('Status buffer full', self.flush_interval)
+            for index, telegram in enumerate(telegrams):
+                row, error = _validate(telegram, vehicles, now)
+                if error:
+                    errors.append({'index': index, 'error': error})
+                    continue
+                current = self._latest.get(row['vehicle_id'])
+                # Late telegrams go to the history but do not replace a newer status
+                row['changed'] = False
+                if current is None or row['timestamp'] >= current['timestamp']:
+                    row['changed'] = current is None or current['status'] != row['status']
+                    self._latest[row['vehicle_id']] = {'status': row['status'], 'timestamp': row['timestamp']}
+                row['source'] = source
+                row['received_at'] = now
+                self._pending.append(row)
+                accepted += 1
+            self.received += accepted
+            self.rejected += len(errors)
+            pending = len(self._pending)
+
+        if accepted:
+            self._ensure_thread()
+            if pending >= self.flush_batch:
+                self._wakeup.set()
+        return accepted, errors
+
+    def _current_assignments(self, vehicle_ids):
+        """First non-completed assignment of an active operation per vehicle"""
+        rows = db.session.query(VehicleAssignment.vehicle_id, Assignment).join(
+            Assignment, VehicleAssignment.assignment_id == Assignment.id
+        ).join(Operation).filter(
+            VehicleAssignment.vehicle_id.in_(vehicle_ids),
+            Assignment.status != AssignmentStatus.COMPLETED,
+            Operation.status == OperationStatus.ACTIVE
+        ).order_by(VehicleAssignment.order, VehicleAssignment.id).all()
+        current = {}
+        for vehicle_id, assignment in rows:
+            current.setdefault(vehicle_id, assignment)
+        return current
+
+    def flush(self):
+        """Write pending telegrams (and journal entries) in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._flushing = len(batch)
+            if not batch:
+                return 0
+            try:
+                db.session.execute(db.insert(VehicleStatusReport), [{
+                    'vehicle_id': row['vehicle_id'],
+                    'status': row['status'],
+                    'timestamp': row['timestamp'],
+                    'received_at': row['received_at'],
+                    'source': row['source']
+                } for row in batch])
+
+                changes = [row for row in batch if row['changed']]
+                assignments = self._current_assignments({row['vehicle_id'] for row in changes}) if changes else {}
+                journal_entries = []
+                for row in changes:
+                    assignment = assignments.get(row['vehicle_id'])
+                    if assignment is None:
+                        continue
+                    journal_entries.append(JournalEntry(
+                        operation_id=assignment.operation_id,
+                        assignment_id=assignment.id,
+                        timestamp=row['timestamp'],
+                        entry_type='vehicle_status',
+                        content=f"Fahrzeug {row['callsign']}: Status {row['status']} ({FMS_STATUS[row['status']]})"
+                    ))
+                db.session.add_all(journal_entries)
+                operation_scope.touch(*{entry.operation_id for entry in journal_entries})
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self._failures += 1
+                with self._lock:
+                    self._flushing = 0
+                    if self._failures < self.max_attempts:
+                        # Keep the telegrams for the next attempt
+                        self._pending[:0] = batch
+                    else:
+                        self._failures = 0
+                        self.dropped += len(batch)
+                        print(f"FMS status flush failed {self.max_attempts} times, dropped {len(batch)} telegrams")
+                raise
+            with self._lock:
+                self._flushing = 0
+            self._failures = 0
+            self.written += len(batch)
+            self.flushes += 1
+            self.journal_entries += len(journal_entries)
+            return len(batch)
+
+    def _flush_in_context(self):
+        with self.app.app_context():
+            try:
+                self.flush()
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self._flush_in_context()
+            except Exception as e:
+                print(f"FMS status flush failed: {e}")
+
+    def latest(self):
+        """Latest status per vehicle id"""
+        self._ensure_loaded()
+        with self._lock:
+            return {vehicle_id: dict(entry) for vehicle_id, entry in self._latest.items()}
+
+    def to_dict(self):
+        with self._lock:
+            pending = len(self._pending) + self._flushing
+        return {
+            'received': self.received,
+            'rejected': self.rejected,
+            'pending': pending,
+            'written': self.written,
+            'dropped': self.dropped,
+            'flushes': self.flushes,
+            'journal_entries': self.journal_entries,
+            'flush_interval': self.flush_interval,
+            'flush_batch': self.flush_batch,
+            'max_pending': self.max_pending
+        }
+
+
+_board = None
+_board_lock = threading.Lock()
+
+
+def get_board(app):
+    """Return the process-wide status board, created on first use"""
+    global _board
+    if _board is None:
+        with _board_lock:
+            if _board is None:
+                _board = StatusBoard(
+                    app,
+                    flush_interval=float(os.environ.get('FMS_FLUSH_INTERVAL', 2.0)),
+                    flush_batch=int(os.environ.get('FMS_FLUSH_BATCH', 500)),
+                    max_pending=int(os.environ.get('FMS_MAX_PENDING', 50000)),
+                    max_attempts=int(os.environ.get('FMS_MAX_ATTEMPTS', 5))
+                )
+    return _board
+
+
+def status_dict(vehicle_id, entry):
+    return {
+        'vehicle_id': vehicle_id,
+        'status': entry['status'],
+        'status_text': FMS_STATUS.get(entry['status']),
+        'timestamp': entry['timestamp'].isoformat()
+    }
@@ -1,6 +1,13 @@
 // API Base URL
 const API_BASE = '/api';
 
+// App shell cache for weak links (see sw.js)
+if ('serviceWorker' in navigator) {
+    window.addEventListener('load', () => {
+        navigator.serviceWorker.register('sw.js').catch(error => console.warn('Service worker not registered:', error));
+    });
+}
+
 // API Helper Functions
 const api = {
     // Operations
@@ -9,9 +16,30 @@ const api = {
         return response.json();
     },
     
+    // Several operations can be active; the selected one is shared by all windows
+    getSelectedOperationId() {
+        return localStorage.getItem('selectedOperationId');
+    },
+    
+    selectOperation(id) {
+        if (id) {
+            localStorage.setItem('selectedOperationId', id);
+        } else {
+            localStorage.removeItem('selectedOperationId');
+        }
+    },
+    
     async getActiveOperation() {
-        const response = await fetch(`${API_BASE}/operations/active`);
-        return response.json();
+        const selectedId = this.getSelectedOperationId();
+        const url = selectedId ?
+            `${API_BASE}/operations/active?operation_id=${selectedId}` :
+            `${API_BASE}/operations/active`;
+        return offlineStore.available ? offlineStore.fetchJson(url) : (await fetch(url)).json();
+    },
+    
+    async getActiveOperations() {
+        const url = `${API_BASE}/operations/?status=active`;
+        return offlineStore.available ? offlineStore.fetchJson(url) : (await fetch(url)).json();
     },
     
     async createOperation(data) {
@@ -32,6 +60,11 @@ const api = {
         return response.json();
     },
     
+    async getOperationStats(id) {
+        const url = `${API_BASE}/operations/${id}/stats`;
+        return offlineStore.available ? offlineStore.fetchJson(url) : (await fetch(url)).json();
+    },
+    
     async closeOperation(id) {
         const response = await fetch(`${API_BASE}/operations/${id}/close`, {
             method: 'POST'
@@ -40,7 +73,11 @@ const api = {
     },
     
     // Assignments
+    // Lists of an operation come from the offline cache, kept current by delta sync
     async getAssignments(operationId = null) {
+        if (operationId && offlineStore.available) {
+            return offlineStore.getAssignments(operationId);
+        }
         const url = operationId ? 
             `${API_BASE}/assignments/?operation_id=${operationId}` :
             `${API_BASE}/assignments/`;
@@ -48,53 +85,51 @@ const api = {
         return response.json();
     },
     
+    // Writes made while offline are queued and return { queued: true }
     async createAssignment(data) {
-        const response = await fetch(`${API_BASE}/assignments/`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(data)
-        });
-        return response.json();
+        return offlineStore.send('POST', `${API_BASE}/assignments/`, data);
     },
     
     async updateAssignment(id, data) {
-        const response = await fetch(`${API_BASE}/assignments/${id}`, {
-            method: 'PUT',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(data)
-        });
-        return response.json();
+        return offlineStore.send('PUT', `${API_BASE}/assignments/${id}`, data);
     },
     
     async completeAssignment(id) {
-        const response = await fetch(`${API_BASE}/assignments/${id}/complete`, {
-            method: 'POST'
-        });
-        return response.json();
+        return offlineStore.send('POST', `${API_BASE}/assignments/${id}/complete`);
     },
     
     async assignVehicle(assignmentId, vehicleId) {
-        const response = await fetch(`${API_BASE}/assignments/${assignmentId}/vehicles`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ vehicle_id: vehicleId })
-        });
-        return response.json();
+        return offlineStore.send('POST', `${API_BASE}/assignments/${assignmentId}/vehicles`, { vehicle_id: vehicleId });
     },
     
     async unassignVehicle(assignmentId, vehicleId) {
-        const response = await fetch(`${API_BASE}/assignments/${assignmentId}/vehicles/${vehicleId}`, {
-            method: 'DELETE'
-        });
+        return offlineStore.send('DELETE', `${API_BASE}/assignments/${assignmentId}/vehicles/${vehicleId}`);
+    },
+    
+    async getVehicleSuggestions(assignmentId, vehicleType = null) {
+        let url = `${API_BASE}/assignments/${assignmentId}/suggestions`;
+        if (vehicleType) url += `?vehicle_type=${encodeURIComponent(vehicleType)}`;
+        const response = await fetch(url);
         return response.json();
     },
     
     // Vehicles
     async getVehicles() {
+        const operationId = this.getSelectedOperationId();
+        if (operationId && offlineStore.available) {
+            return offlineStore.getVehicles(operationId);
+        }
         const response = await fetch(`${API_BASE}/vehicles/`);
         return response.json();
     },
     
+    // Latest FMS status per vehicle id
+    async getVehicleStatuses() {
+        const url = `${API_BASE}/vehicles/status`;
+        const statuses = offlineStore.available ? await offlineStore.fetchJson(url) : await (await fetch(url)).json();
+        return Object.fromEntries(statuses.map(s => [s.vehicle_id, s]));
+    },
+    
     async getVehiclesByLocation() {
         const response = await fetch(`${API_BASE}/vehicles/by-location`);
         return response.json();
@@ -127,8 +162,8 @@ const api = {
     
     // Locations
     async getLocations() {
-        const response = await fetch(`${API_BASE}/locations/`);
-        return response.json();
+        const url = `${API_BASE}/locations/`;
+        return offlineStore.available ? offlineStore.fetchJson(url) : (await fetch(url)).json();
     },
     
     async createLocation(data) {
@@ -158,6 +193,9 @@ const api = {
     
     // Journal
     async getJournalEntries(operationId = null, assignmentId = null) {
+        if (operationId && offlineStore.available) {
+            return offlineStore.getJournalEntries(operationId, assignmentId);
+        }
         let url = `${API_BASE}/journal/`;
         const params = new URLSearchParams();
         if (operationId) params.append('operation_id', operationId);
@@ -169,11 +207,6 @@ const api = {
     },
     
     async createJournalEntry(data) {
-        const response = await fetch(`${API_BASE}/journal/`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(data)
-        });
-        return response.json();
+        return offlineStore.send('POST', `${API_BASE}/journal/`, data);
     }
 };
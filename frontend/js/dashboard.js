@@ -2,6 +2,8 @@
 let dashboardData = {
     assignments: [],
     vehicles: [],
+    stats: null,
+    statuses: {},
     operation: null
 };
 
@@ -12,6 +14,13 @@ function getSequentialNumber(assignmentNumber) {
     return parts.length > 0 ? parts[parts.length - 1] : assignmentNumber;
 }
 
+// FMS status badge of a vehicle (empty if no status was reported yet)
+function getFmsStatusHtml(vehicle) {
+    const status = dashboardData.statuses[vehicle.id];
+    if (!status) return '';
+    return `<span class="fms-status fms-status-${status.status}" title="${status.status_text}">${status.status}</span>`;
+}
+
 document.addEventListener('DOMContentLoaded', async () => {
     await updateDashboard();
     setInterval(updateDashboard, 3000); // Update every 3 seconds
@@ -28,8 +37,10 @@ async function updateDashboard() {
         }
         
         // Load data
-        dashboardData.assignments = await api.getAssignments();
+        dashboardData.assignments = await api.getAssignments(dashboardData.operation.id);
         dashboardData.vehicles = await api.getVehicles();
+        dashboardData.stats = await api.getOperationStats(dashboardData.operation.id);
+        dashboardData.statuses = await api.getVehicleStatuses();
         
         // Update displays
         updateStatistics();
@@ -49,27 +60,13 @@ function showNoOperation() {
 }
 
 function updateStatistics() {
-    // Count statistics
-    const totalAssignments = dashboardData.assignments.length;
-    const assignedVehicles = new Set();
-    let totalPersonnel = 0;
-    
-    dashboardData.assignments.forEach(assignment => {
-        if (assignment.status !== 'completed') {
-            assignment.vehicles.forEach(vehicleCallsign => {
-                assignedVehicles.add(vehicleCallsign);
-                const vehicle = dashboardData.vehicles.find(v => v.callsign === vehicleCallsign);
-                if (vehicle) {
-                    totalPersonnel += vehicle.crew_count;
-                }
-            });
-        }
-    });
+    // Counters are maintained server-side
+    const stats = dashboardData.stats;
     
     // Update display
-    document.getElementById('statsAssignments').textContent = totalAssignments;
-    document.getElementById('statsVehicles').textContent = assignedVehicles.size;
-    document.getElementById('statsPersonnel').textContent = totalPersonnel;
+    document.getElementById('statsAssignments').textContent = stats.assignments.total;
+    document.getElementById('statsVehicles').textContent = stats.vehicles;
+    document.getElementById('statsPersonnel').textContent = stats.personnel;
 }
 
 function updateAssignmentsDisplay() {
@@ -185,7 +182,7 @@ function renderActiveVehicles(vehicleData) {
         
         card.innerHTML = `
             <div class="vehicle-info">
-                <div class="vehicle-callsign">${vehicle.callsign}</div>
+                <div class="vehicle-callsign">${vehicle.callsign} ${getFmsStatusHtml(vehicle)}</div>
                 <div class="vehicle-type">${vehicle.vehicle_type || ''}</div>
                 <div class="vehicle-crew">👥 ${vehicle.crew_count}</div>
             </div>
@@ -219,7 +216,7 @@ function renderVehiclesByLocation(vehiclesByLocation) {
             card.className = 'vehicle-card inactive';
             
             card.innerHTML = `
-                <div class="vehicle-callsign-small">${vehicle.callsign}</div>
+                <div class="vehicle-callsign-small">${vehicle.callsign} ${getFmsStatusHtml(vehicle)}</div>
                 <div class="vehicle-type-small">${vehicle.vehicle_type || ''}</div>
                 <div class="vehicle-crew-small">👥 ${vehicle.crew_count}</div>
             `;
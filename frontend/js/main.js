@@ -1,5 +1,6 @@
 // Main Application Logic
 let currentOperation = null;
+let activeOperations = [];
 let assignments = [];
 let vehicles = [];
 let locations = [];
@@ -17,13 +18,23 @@ document.addEventListener('DOMContentLoaded', async () => {
     await loadData();
     setupEventListeners();
     setupTabs();
+    // Show the result of writes queued while offline
+    window.addEventListener('offline-replayed', loadData);
 });
 
 async function loadActiveOperation() {
     currentOperation = await api.getActiveOperation();
+    activeOperations = await api.getActiveOperations();
+    api.selectOperation(currentOperation ? currentOperation.id : null);
     updateOperationDisplay();
 }
 
+async function switchOperation(operationId) {
+    api.selectOperation(operationId);
+    await loadActiveOperation();
+    await loadData();
+}
+
 function updateOperationDisplay() {
     const operationInfo = document.getElementById('operationInfo');
     const operationDetails = document.getElementById('operationDetails');
@@ -31,6 +42,18 @@ function updateOperationDisplay() {
     const newOperationBtn = document.getElementById('newOperationBtn');
     const openMapBtn = document.getElementById('openMapBtn');
     const openDashboardBtn = document.getElementById('openDashboardBtn');
+    const operationSelect = document.getElementById('operationSelect');
+    
+    // Selector only when several operations run at the same time
+    operationSelect.innerHTML = '';
+    activeOperations.forEach(operation => {
+        const option = document.createElement('option');
+        option.value = operation.id;
+        option.textContent = `${operation.number} - ${operation.title}`;
+        option.selected = currentOperation && operation.id === currentOperation.id;
+        operationSelect.appendChild(option);
+    });
+    operationSelect.style.display = activeOperations.length > 1 ? 'inline-block' : 'none';
     
     if (currentOperation) {
         operationInfo.style.display = 'block';
@@ -41,7 +64,7 @@ function updateOperationDisplay() {
             ${currentOperation.description ? `<p><strong>Beschreibung:</strong> ${currentOperation.description}</p>` : ''}
         `;
         closeBtn.style.display = 'inline-block';
-        newOperationBtn.style.display = 'none';
+        newOperationBtn.style.display = 'inline-block';
         openMapBtn.style.display = 'inline-block';
         openDashboardBtn.style.display = 'inline-block';
     } else {
@@ -54,7 +77,7 @@ function updateOperationDisplay() {
 }
 
 async function loadData() {
-    assignments = await api.getAssignments();
+    assignments = currentOperation ? await api.getAssignments(currentOperation.id) : [];
     vehicles = await api.getVehicles();
     locations = await api.getLocations();
     
@@ -87,6 +110,7 @@ function setupEventListeners() {
     // Operation Modal
     document.getElementById('newOperationBtn').addEventListener('click', openOperationModal);
     document.getElementById('operationForm').addEventListener('submit', handleOperationSubmit);
+    document.getElementById('operationSelect').addEventListener('change', (e) => switchOperation(e.target.value));
     
     // Assignment Modal
     document.getElementById('newAssignmentBtn').addEventListener('click', () => openAssignmentModal());
@@ -255,10 +279,9 @@ async function handleOperationSubmit(e) {
         description: document.getElementById('operationDescription').value
     };
     
-    currentOperation = await api.createOperation(data);
+    const operation = await api.createOperation(data);
     document.getElementById('operationModal').classList.remove('active');
-    updateOperationDisplay();
-    await loadData();
+    await switchOperation(operation.id);
 }
 
 async function handleAssignmentSubmit(e) {
@@ -270,7 +293,8 @@ async function handleAssignmentSubmit(e) {
         location_address: document.getElementById('assignmentLocation').value,
         description: document.getElementById('assignmentDescription').value,
         latitude: document.getElementById('assignmentLat').value || null,
-        longitude: document.getElementById('assignmentLon').value || null
+        longitude: document.getElementById('assignmentLon').value || null,
+        operation_id: currentOperation.id
     };
     
     if (assignmentId) {
@@ -330,7 +354,8 @@ async function handleJournalSubmit(e) {
     const data = {
         entry_type: document.getElementById('journalType').value,
         assignment_id: document.getElementById('journalAssignment').value || null,
-        content: document.getElementById('journalContent').value
+        content: document.getElementById('journalContent').value,
+        operation_id: currentOperation.id
     };
     
     await api.createJournalEntry(data);
@@ -343,10 +368,9 @@ async function handleCloseOperation() {
     
     if (confirm('Möchten Sie die Einsatzlage wirklich schließen? Danach sind keine Änderungen mehr möglich.')) {
         await api.closeOperation(currentOperation.id);
-        currentOperation = null;
         assignments = [];
-        updateOperationDisplay();
-        await loadData();
+        // Continue with another active operation, if any
+        await switchOperation(null);
     }
 }
 
@@ -509,15 +533,24 @@ async function manageVehicles(assignmentId) {
     const assignment = assignments.find(a => a.id === assignmentId);
     if (!assignment) return;
     
+    // Nearest free vehicles first (no suggestions while offline)
+    let suggestions = [];
+    try {
+        suggestions = await api.getVehicleSuggestions(assignmentId);
+    } catch (error) {
+        console.warn('Vehicle suggestions unavailable:', error);
+    }
+    const distances = Object.fromEntries((Array.isArray(suggestions) ? suggestions : [])
+        .map(s => [s.vehicle_id, s.distance_km]));
     const availableVehicles = vehicles.filter(v => 
         !assignment.vehicles.includes(v.callsign)
-    );
+    ).sort((a, b) => (distances[a.id] ?? Infinity) - (distances[b.id] ?? Infinity));
     
     let message = `Auftrag: ${getSequentialNumber(assignment.number)} - ${assignment.title}\n\n`;
     message += `Zugewiesene Fahrzeuge:\n`;
     assignment.vehicles.forEach(v => message += `- ${v}\n`);
     message += `\nVerfügbare Fahrzeuge:\n`;
-    availableVehicles.forEach((v, i) => message += `${i+1}. ${v.callsign}\n`);
+    availableVehicles.forEach((v, i) => message += `${i+1}. ${v.callsign}${v.id in distances ? ` (${distances[v.id]} km)` : ''}\n`);
     
     const choice = prompt(message + '\nGeben Sie die Nummer des zuzuweisenden Fahrzeugs ein (oder "remove X" zum Entfernen):');
     
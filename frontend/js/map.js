@@ -4,6 +4,7 @@ let markers = {};
 let dashboardData = {
     assignments: [],
     vehicles: [],
+    statuses: {},
     operation: null
 };
 
@@ -18,6 +19,13 @@ function getSequentialNumber(assignmentNumber) {
     return parts.length > 0 ? parts[parts.length - 1] : assignmentNumber;
 }
 
+// FMS status badge of a vehicle (empty if no status was reported yet)
+function getFmsStatusHtml(vehicle) {
+    const status = dashboardData.statuses[vehicle.id];
+    if (!status) return '';
+    return `<span class="fms-status fms-status-${status.status}" title="${status.status_text}">${status.status}</span>`;
+}
+
 // Initialize map
 document.addEventListener('DOMContentLoaded', async () => {
     // Check if Leaflet is available
@@ -41,6 +49,9 @@ document.addEventListener('DOMContentLoaded', async () => {
         }
     }
     
+    // Load all tactical symbols in one request before the first render
+    await loadTacticalSymbolSprite();
+    
     // Start updating (sidebars will still work)
     updateMap();
     setInterval(updateMap, 5000); // Update every 5 seconds
@@ -59,11 +70,12 @@ async function updateMap() {
         }
         
         // Get assignments and vehicles
-        const assignments = await api.getAssignments();
+        const assignments = await api.getAssignments(operation.id);
         const vehicles = await api.getVehicles();
         
         dashboardData.assignments = assignments;
         dashboardData.vehicles = vehicles;
+        dashboardData.statuses = await api.getVehicleStatuses();
         
         // Only update map markers if Leaflet is available
         if (typeof L !== 'undefined' && map) {
@@ -181,15 +193,15 @@ function addVehicleMarker(vehicle, assignment, offsetIndex) {
     const offsetLat = assignment.latitude + latOffset;
     const offsetLng = assignment.longitude + lngOffset;
     
-    // Get tactical symbol path
-    const symbolPath = getTacticalSymbolPath(vehicle.vehicle_type);
+    // Get tactical symbol from the sprite
+    const symbolHtml = getTacticalSymbolHtml(vehicle.vehicle_type);
     
     // Create custom icon with tactical symbol or text fallback
     let iconHtml;
-    if (symbolPath) {
+    if (symbolHtml) {
         iconHtml = `
             <div class="vehicle-marker-tactical">
-                <img src="${symbolPath}" alt="${vehicle.vehicle_type}" class="tactical-symbol">
+                ${symbolHtml}
                 <div class="vehicle-marker-label">${vehicle.callsign}</div>
             </div>
         `;
@@ -204,8 +216,8 @@ function addVehicleMarker(vehicle, assignment, offsetIndex) {
     const icon = L.divIcon({
         className: 'custom-marker',
         html: iconHtml,
-        iconSize: symbolPath ? [60, 80] : [80, 40],
-        iconAnchor: symbolPath ? [30, 70] : [40, 20]
+        iconSize: symbolHtml ? [60, 80] : [80, 40],
+        iconAnchor: symbolHtml ? [30, 70] : [40, 20]
     });
     
     const marker = L.marker([offsetLat, offsetLng], { 
@@ -223,6 +235,7 @@ function addVehicleMarker(vehicle, assignment, offsetIndex) {
         <strong>${vehicle.callsign}</strong><br>
         Typ: ${vehicle.vehicle_type || 'N/A'}<br>
         Besatzung: ${vehicle.crew_count}<br>
+        ${dashboardData.statuses[vehicle.id] ? `Status: ${dashboardData.statuses[vehicle.id].status} (${dashboardData.statuses[vehicle.id].status_text})<br>` : ''}
         ${vehicleAssignments.length > 0 ? `Aufträge: ${assignmentNumbers}` : 'Kein Auftrag'}
     `;
     
@@ -298,7 +311,7 @@ function updateDeployedVehicles() {
         }
         
         card.innerHTML = `
-            <div class="sidebar-vehicle-callsign">${vehicle.callsign}</div>
+            <div class="sidebar-vehicle-callsign">${vehicle.callsign} ${getFmsStatusHtml(vehicle)}</div>
             <div class="sidebar-vehicle-type">${vehicle.vehicle_type || ''}</div>
             <div class="sidebar-vehicle-crew">👥 ${vehicle.crew_count}</div>
             ${assignmentsHtml}
@@ -355,7 +368,7 @@ function updateAvailableVehicles() {
             card.className = 'sidebar-vehicle-card inactive';
             
             card.innerHTML = `
-                <div class="sidebar-vehicle-callsign">${vehicle.callsign}</div>
+                <div class="sidebar-vehicle-callsign">${vehicle.callsign} ${getFmsStatusHtml(vehicle)}</div>
                 <div class="sidebar-vehicle-type inactive-text">${vehicle.vehicle_type || ''}</div>
                 <div class="sidebar-vehicle-crew inactive-text">👥 ${vehicle.crew_count}</div>
             `;
@@ -0,0 +1,321 @@
+// Offline cache (IndexedDB) of the selected operation with delta sync and a write outbox
+//
+// Assignments, journal entries and vehicles are kept per operation and
+// refreshed through /api/sync, which only returns rows changed since the
+// last known revision. Reads are served from the cache, so the pages keep
+// working while the link to the server is down. Writes made while offline
+// are queued in the outbox and sent in order once the link is back; while
+// entries are waiting, sending is retried with backoff. Every write carries
+// an Idempotency-Key, so a write whose response was lost is applied once.
+const offlineStore = (() => {
+    const DB_NAME = 'tel-offline';
+    const DB_VERSION = 1;
+    const SYNC_MIN_INTERVAL = 1000; // ms, reads right after a sync reuse it
+    const RETRY_MIN = 2000; // ms, first outbox retry, doubled up to RETRY_MAX
+    const RETRY_MAX = 60000;
+
+    const available = 'indexedDB' in window;
+    let dbPromise = null;
+    const running = {};
+    let lastSync = {};
+    let replaying = false;
+    let retryTimer = null;
+    let retryDelay = RETRY_MIN;
+
+    function openDb() {
+        if (!dbPromise) {
+            dbPromise = new Promise((resolve, reject) => {
+                const request = indexedDB.open(DB_NAME, DB_VERSION);
+                request.onupgradeneeded = () => {
+                    const db = request.result;
+                    ['assignments', 'journal'].forEach(name => {
+                        const store = db.createObjectStore(name, { keyPath: 'id' });
+                        store.createIndex('operation_id', 'operation_id');
+                    });
+                    db.createObjectStore('vehicles', { keyPath: 'id' });
+                    db.createObjectStore('meta', { keyPath: 'operation_id' });
+                    db.createObjectStore('responses', { keyPath: 'url' });
+                    db.createObjectStore('outbox', { keyPath: 'id', autoIncrement: true });
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+        return dbPromise;
+    }
+
+    // Run fn(stores) in one transaction, resolving with its result once committed
+    async function transaction(names, mode, fn) {
+        const db = await openDb();
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction(names, mode);
+            const stores = Object.fromEntries(names.map(name => [name, tx.objectStore(name)]));
+            let result;
+            Promise.resolve(fn(stores)).then(value => { result = value; });
+            tx.oncomplete = () => resolve(result);
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+    }
+
+    function requestResult(request) {
+        return new Promise((resolve, reject) => {
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    async function getMeta(operationId) {
+        return transaction(['meta'], 'readonly', stores => requestResult(stores.meta.get(operationId)));
+    }
+
+    // Delete the rows of an operation that are not part of a snapshot
+    function deleteMissing(store, operationId, keep) {
+        store.index('operation_id').openKeyCursor(IDBKeyRange.only(operationId)).onsuccess = event => {
+            const cursor = event.target.result;
+            if (!cursor) return;
+            if (!keep.has(cursor.primaryKey)) store.delete(cursor.primaryKey);
+            cursor.continue();
+        };
+    }
+
+    async function applyChanges(operationId, changes, meta) {
+        await transaction(['assignments', 'journal', 'vehicles', 'meta'], 'readwrite', stores => {
+            if (changes.full) {
+                deleteMissing(stores.assignments, operationId, new Set(changes.assignments.map(a => a.id)));
+                deleteMissing(stores.journal, operationId, new Set(changes.journal.map(e => e.id)));
+                stores.vehicles.clear();
+            }
+            changes.assignments.forEach(a => stores.assignments.put(a));
+            changes.journal.forEach(e => stores.journal.put(e));
+            changes.vehicles.forEach(v => stores.vehicles.put(v));
+            changes.deleted.assignments.forEach(id => stores.assignments.delete(id));
+            changes.deleted.journal.forEach(id => stores.journal.delete(id));
+            changes.deleted.vehicles.forEach(id => stores.vehicles.delete(id));
+            stores.meta.put({
+                operation_id: operationId,
+                revision: changes.revision,
+                operation: changes.operation || (meta ? meta.operation : null),
+                synced_at: new Date().toISOString()
+            });
+        });
+    }
+
+    async function runSync(operationId) {
+        const meta = await getMeta(operationId);
+        const since = meta ? meta.revision : 0;
+        const response = await fetch(`${API_BASE}/sync?operation_id=${operationId}&since=${since}`);
+        if (!response.ok) throw new Error(`Sync failed: ${response.status}`);
+        const changes = await response.json();
+        await applyChanges(operationId, changes, meta);
+        lastSync[operationId] = Date.now();
+        // The server is reachable again
+        replay();
+        return changes;
+    }
+
+    // Concurrent calls for the same operation share one request
+    function sync(operationId) {
+        operationId = Number(operationId);
+        if (!running[operationId]) {
+            running[operationId] = runSync(operationId).finally(() => { delete running[operationId]; });
+        }
+        return running[operationId];
+    }
+
+    // Sync (if due) and read from the cache; stale data is used if the server is unreachable
+    async function cached(operationId, read) {
+        operationId = Number(operationId);
+        if (!lastSync[operationId] || Date.now() - lastSync[operationId] > SYNC_MIN_INTERVAL) {
+            try {
+                await sync(operationId);
+            } catch (error) {
+                if (!(await getMeta(operationId))) throw error;
+                if (navigator.onLine) console.warn('Sync failed, using cached data:', error);
+            }
+        }
+        return read(operationId);
+    }
+
+    async function getAssignments(operationId) {
+        return cached(operationId, async id => {
+            const rows = await transaction(['assignments'], 'readonly', stores =>
+                requestResult(stores.assignments.index('operation_id').getAll(id)));
+            return rows.sort((a, b) => (a.created_at || '').localeCompare(b.created_at || ''));
+        });
+    }
+
+    async function getJournalEntries(operationId, assignmentId = null) {
+        return cached(operationId, async id => {
+            const rows = await transaction(['journal'], 'readonly', stores =>
+                requestResult(stores.journal.index('operation_id').getAll(id)));
+            return rows
+                .filter(e => !assignmentId || e.assignment_id === Number(assignmentId))
+                .sort((a, b) => (a.timestamp || '').localeCompare(b.timestamp || ''));
+        });
+    }
+
+    async function getVehicles(operationId) {
+        return cached(operationId, () =>
+            transaction(['vehicles'], 'readonly', stores => requestResult(stores.vehicles.getAll())));
+    }
+
+    // GET a JSON resource outside the sync, falling back to the last response
+    async function fetchJson(url) {
+        try {
+            const response = await fetch(url);
+            const data = await response.json();
+            if (response.ok) {
+                transaction(['responses'], 'readwrite', stores => stores.responses.put({ url, data }))
+                    .catch(error => console.warn('Could not cache response:', error));
+            }
+            return data;
+        } catch (error) {
+            const entry = await transaction(['responses'], 'readonly', stores =>
+                requestResult(stores.responses.get(url)));
+            if (!entry) throw error;
+            return entry.data;
+        }
+    }
+
+    // Outbox
+
+    async function queuedCount() {
+        return transaction(['outbox'], 'readonly', stores => requestResult(stores.outbox.count()));
+    }
+
+    function newKey() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+    }
+
+    async function enqueue(method, url, data, key) {
+        await transaction(['outbox'], 'readwrite', stores => stores.outbox.add({
+            method, url, data, key, queued_at: new Date().toISOString()
+        }));
+        updateBanner();
+        return { queued: true };
+    }
+
+    function request(method, url, data, key) {
+        const options = { method, headers: {} };
+        if (key) options.headers['Idempotency-Key'] = key;
+        if (data !== undefined) {
+            options.headers['Content-Type'] = 'application/json';
+            options.body = JSON.stringify(data);
+        }
+        return fetch(url, options);
+    }
+
+    // Try the outbox again later, waiting longer after every failed attempt
+    function scheduleReplay() {
+        if (retryTimer) return;
+        retryTimer = setTimeout(() => {
+            retryTimer = null;
+            replay();
+        }, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, RETRY_MAX);
+    }
+
+    // Send a write, or queue it while offline (and behind writes queued earlier)
+    async function send(method, url, data) {
+        lastSync = {};
+        if (!available) {
+            return (await request(method, url, data)).json();
+        }
+        const key = newKey();
+        if (!navigator.onLine || await queuedCount() > 0) {
+            const result = await enqueue(method, url, data, key);
+            replay();
+            return result;
+        }
+        let response;
+        try {
+            response = await request(method, url, data, key);
+        } catch (error) {
+            // Network error: the server may still have applied the write, the
+            // replay sends the same key so it is not applied twice
+            const result = await enqueue(method, url, data, key);
+            scheduleReplay();
+            return result;
+        }
+        return response.json();
+    }
+
+    // Send queued writes in order; stops at the first network or server error
+    async function replay() {
+        if (replaying || !navigator.onLine) return;
+        replaying = true;
+        let sent = 0;
+        let failed = false;
+        try {
+            while (true) {
+                const entry = await transaction(['outbox'], 'readonly', stores => new Promise(resolve => {
+                    stores.outbox.openCursor().onsuccess = event => {
+                        const cursor = event.target.result;
+                        resolve(cursor ? cursor.value : null);
+                    };
+                }));
+                if (!entry) break;
+
+                let response;
+                try {
+                    response = await request(entry.method, entry.url, entry.data, entry.key);
+                } catch (error) {
+                    failed = true;
+                    break;
+                }
+                if (response.status >= 500) {
+                    failed = true;
+                    break;
+                }
+                if (!response.ok) {
+                    // Rejected writes (e.g. operation closed meanwhile) cannot succeed later
+                    console.warn(`Dropped queued ${entry.method} ${entry.url}: ${response.status}`);
+                }
+                await transaction(['outbox'], 'readwrite', stores => stores.outbox.delete(entry.id));
+                sent++;
+            }
+        } finally {
+            replaying = false;
+            updateBanner();
+        }
+        if (failed) {
+            scheduleReplay();
+        } else {
+            retryDelay = RETRY_MIN;
+        }
+        if (sent) {
+            lastSync = {};
+            window.dispatchEvent(new CustomEvent('offline-replayed', { detail: { sent } }));
+        }
+    }
+
+    async function updateBanner() {
+        let banner = document.getElementById('offlineBanner');
+        const queued = available ? await queuedCount() : 0;
+        if (navigator.onLine && queued === 0) {
+            if (banner) banner.remove();
+            return;
+        }
+        if (!banner) {
+            banner = document.createElement('div');
+            banner.id = 'offlineBanner';
+            banner.className = 'offline-banner';
+            document.body.appendChild(banner);
+        }
+        const pending = queued ? ` - ${queued} Änderung(en) warten auf Übertragung` : '';
+        banner.textContent = (navigator.onLine ? 'Verbindung wiederhergestellt' : 'Offline: Anzeige aus dem lokalen Zwischenspeicher') + pending;
+    }
+
+    if (available) {
+        window.addEventListener('online', () => replay());
+        window.addEventListener('offline', () => updateBanner());
+        window.addEventListener('DOMContentLoaded', () => {
+            updateBanner();
+            replay();
+        });
+    }
+
+    return { available, sync, getAssignments, getJournalEntries, getVehicles, fetchJson, send, replay, queuedCount };
+})();
@@ -1,36 +1,46 @@
-// Mapping of vehicle types to tactical symbol filenames
-const TACTICAL_SYMBOLS = {
-    // Einsatzleitung
-    'ELW': 'ELW_1.svg',
-    
-    // Löschfahrzeuge
-    'HLF': 'Hilfeleistungslöschfahrzeug.svg',
-    'LF': 'Löschfahrzeug.svg',
-    'StLF': 'Löschfahrzeug_10.svg',
-    'TLF': 'Tanklöschfahrzeug.svg',
-    'TSF': 'Tragkraftspritzenfahrzeug.svg',
-    'TSF-W': 'Tragkraftspritzenfahrzeug.svg',
-    
-    // Rüst- und Gerätewagen
-    'GW-L1': 'Gerätewagen_Logistik_1.svg',
-    'GW-L2': 'Gerätewagen_Logistik_2.svg',
-    'RW': 'Rüstwagen.svg',
-    
-    // Mannschaft und Transport
-    'MTF': 'Mannschaftstransportwagen.svg',
-    'MTW': 'Mannschaftstransportwagen.svg',
-    
-    // Hubrettungsfahrzeuge
-    'DLK': 'Drehleiter_Automatik_mit Korb.svg',
+// Sprite manifest, filled by loadTacticalSymbolSprite(). The backend owns the
+// vehicle type mapping: types (vehicle type -> symbol id) and symbols
+// (symbol id -> viewBox and file name).
+let tacticalSymbolManifest = null;
+let tacticalSymbolSpriteLoaded = false;
+
+// Load all symbols with one request and inline the sprite so they can be
+// referenced with <use>. Falls back to the individual files if only the
+// manifest is available.
+async function loadTacticalSymbolSprite() {
+    if (tacticalSymbolManifest) return tacticalSymbolManifest;
+    const [manifestResult, spriteResult] = await Promise.allSettled([
+        fetch('/api/symbols/manifest').then(response => response.ok ? response.json() : null),
+        fetch('/api/symbols/sprite.svg').then(response => response.ok ? response.text() : null)
+    ]);
+    if (manifestResult.status !== 'fulfilled' || !manifestResult.value) {
+        console.warn('Tactical symbol manifest not available:', manifestResult.reason);
+        return null;
+    }
+    tacticalSymbolManifest = manifestResult.value;
     
-    // Rettungsfahrzeuge
-    'KTW': 'Krankentransportwagen.svg',
-    'NEF': 'Notarzteinsatzfahrzeug.svg',
-    'RTW': 'Rettungswagen.svg',
+    if (spriteResult.status === 'fulfilled' && spriteResult.value) {
+        const container = document.createElement('div');
+        container.style.display = 'none';
+        container.innerHTML = spriteResult.value;
+        document.body.insertBefore(container, document.body.firstChild);
+        tacticalSymbolSpriteLoaded = true;
+    }
+    return tacticalSymbolManifest;
+}
+
+// Get markup for a tactical symbol: a <use> reference into the sprite, or an
+// <img> of the single file if the sprite is not loaded
+function getTacticalSymbolHtml(vehicleType, altText = vehicleType) {
+    const symbolId = tacticalSymbolManifest && tacticalSymbolManifest.types[vehicleType];
+    if (symbolId && tacticalSymbolSpriteLoaded) {
+        const viewBox = tacticalSymbolManifest.symbols[symbolId].viewBox;
+        return `<svg class="tactical-symbol" viewBox="${viewBox}" role="img" aria-label="${altText}"><use href="#${symbolId}"></use></svg>`;
+    }
     
-    // Station/Gerätehaus
-    'STATION': 'Feuerwehrgerätehaus.svg'
-};
+    const symbolPath = getTacticalSymbolPath(vehicleType);
+    return symbolPath ? `<img src="${symbolPath}" alt="${altText}" class="tactical-symbol">` : null;
+}
 
 // Get the path to a tactical symbol
 function getTacticalSymbolPath(vehicleType) {
@@ -39,7 +49,8 @@ function getTacticalSymbolPath(vehicleType) {
         return null;
     }
     
-    const filename = TACTICAL_SYMBOLS[vehicleType];
+    const symbolId = tacticalSymbolManifest && tacticalSymbolManifest.types[vehicleType];
+    const filename = symbolId && tacticalSymbolManifest.symbols[symbolId].file;
     if (filename) {
         // Return path with proper URL encoding
         // encodeURIComponent properly handles Unicode characters and spaces
@@ -57,5 +68,6 @@ function getStationSymbolPath() {
 
 // Get all available vehicle types
 function getVehicleTypes() {
-    return Object.keys(TACTICAL_SYMBOLS).filter(type => type !== 'STATION');
+    const types = tacticalSymbolManifest ? Object.keys(tacticalSymbolManifest.types) : [];
+    return types.filter(type => type !== 'STATION');
 }
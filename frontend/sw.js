@@ -0,0 +1,78 @@
+// Service worker: keeps the app shell available when the link to the command post drops
+//
+// Pages are loaded network-first (falling back to the cached copy), static
+// files are served from the cache and refreshed in the background. API
+// requests are not touched; their data is cached in IndexedDB by
+// js/offline-store.js.
+const CACHE_NAME = 'tel-shell-v1';
+
+const APP_SHELL = [
+    './',
+    'index.html',
+    'dashboard.html',
+    'map.html',
+    'history.html',
+    'css/style.css',
+    'css/dashboard.css',
+    'js/offline-store.js',
+    'js/api.js',
+    'js/main.js',
+    'js/dashboard.js',
+    'js/map.js',
+    'js/history.js',
+    'js/tactical-symbols.js'
+];
+
+// Leaflet is loaded from a CDN
+const CACHED_ORIGINS = [self.location.origin, 'https://unpkg.com'];
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(CACHE_NAME)
+            .then(cache => cache.addAll(APP_SHELL))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(names.filter(name => name !== CACHE_NAME).map(name => caches.delete(name))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (request.method !== 'GET' || !CACHED_ORIGINS.includes(url.origin)) return;
+    if (url.origin === self.location.origin && url.pathname.startsWith('/api')) return;
+
+    if (request.mode === 'navigate') {
+        event.respondWith(
+            fetch(request)
+                .then(response => {
+                    const copy = response.clone();
+                    caches.open(CACHE_NAME).then(cache => cache.put(request, copy));
+                    return response;
+                })
+                .catch(() => caches.match(request, { ignoreSearch: true }).then(cached => cached || caches.match('index.html')))
+        );
+        return;
+    }
+
+    // Stale-while-revalidate: a new deployment is picked up on the next load
+    event.respondWith(
+        caches.open(CACHE_NAME).then(cache => cache.match(request).then(cached => {
+            const update = fetch(request).then(response => {
+                if (response.ok || response.type === 'opaque') cache.put(request, response.clone());
+                return response;
+            });
+            if (cached) {
+                event.waitUntil(update.catch(() => {}));
+                return cached;
+            }
+            return update;
+        }))
+    );
+});